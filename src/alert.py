@@ -38,6 +38,7 @@ class Alert:
         id=None,
         start_time=None,
         status=ALERT_LABEL_2_CODE["Pending"],
+        caption="",
     ):
         self.id = generate_id() if id is None else id
         self.unknown_ids = unknown_ids
@@ -46,6 +47,10 @@ class Alert:
         self.start_time = update_time if start_time is None else start_time
         self.update_time = update_time
         self.status = status
+        self.caption = caption
 
     def __str__(self):
-        return f"🚨 Alert! {len(self.unknown_ids)} unknown people detected. Alert started at {self.start_time.strftime('%Y-%m-%d %H:%M:%S')} and updated at {self.update_time.strftime('%Y-%m-%d %H:%M:%S')}"
+        message = f"🚨 Alert! {len(self.unknown_ids)} unknown people detected. Alert started at {self.start_time.strftime('%Y-%m-%d %H:%M:%S')} and updated at {self.update_time.strftime('%Y-%m-%d %H:%M:%S')}"
+        if self.caption:
+            message += f" Scene: {self.caption}"
+        return message
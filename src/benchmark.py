@@ -0,0 +1,454 @@
+import argparse
+import csv
+import datetime
+import os
+import time
+import cv2
+import numpy as np
+
+from capture import open_source, ImageDirSource
+
+
+def load_frames(source_path, max_frames):
+    source = open_source(source_path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = source.read()
+        if not ret:
+            break
+        frames.append(frame)
+    source.release()
+    if not frames:
+        raise ValueError(f"No frames read from {source_path}")
+    return frames
+
+
+def percentiles_ms(samples):
+    ms = np.array(samples) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 95)
+
+
+def token_f1(caption, reference):
+    tokens, ref_tokens = caption.lower().split(), reference.lower().split()
+    common = sum(min(tokens.count(t), ref_tokens.count(t)) for t in set(tokens))
+    if common == 0:
+        return 0.0
+    precision, recall = common / len(tokens), common / len(ref_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def benchmark_caption_backends(frames, backends, decoding="greedy", max_length=30):
+    from caption_model import CaptionHandler
+
+    # The first backend is the reference the others are compared against.
+    results = {}
+    reference = None
+    for backend in backends:
+        start = time.perf_counter()
+        handler = CaptionHandler(
+            backend=backend, decoding=decoding, max_length=max_length
+        )
+        load_sec = time.perf_counter() - start
+        handler.generate_caption(frames[0])  # warm-up
+
+        captions, samples = [], []
+        for frame in frames:
+            start = time.perf_counter()
+            captions.append(handler.generate_caption(frame))
+            samples.append(time.perf_counter() - start)
+        if reference is None:
+            reference = captions
+
+        p50, p95 = percentiles_ms(samples)
+        results[backend] = {
+            "load_sec": load_sec,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "exact_match": np.mean([c == r for c, r in zip(captions, reference)]),
+            "token_f1": np.mean([token_f1(c, r) for c, r in zip(captions, reference)]),
+        }
+        del handler
+
+    print(f"📊 Caption backends ({len(frames)} frames, {decoding} decoding):")
+    print(
+        f"   {'backend':<12} {'load s':>7} {'p50 ms':>9} {'p95 ms':>9} {'exact':>6} {'tok F1':>7}"
+    )
+    for backend, r in results.items():
+        print(
+            f"   {backend:<12} {r['load_sec']:>7.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+            f"{r['exact_match']:>6.2f} {r['token_f1']:>7.2f}"
+        )
+    return results
+
+
+def synthetic_encodings(num_encodings, per_identity=5, noise=0.05, seed=0):
+    # Unit-norm identity centres with a few noisy encodings each, roughly like
+    # dlib encodings where same-person distances are well below 0.6.
+    rng = np.random.default_rng(seed)
+    num_identities = max(1, num_encodings // per_identity)
+    centres = rng.standard_normal((num_identities, 128), dtype=np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    identity_ids = rng.integers(0, num_identities, num_encodings)
+    encodings = centres[identity_ids]
+    encodings += noise * rng.standard_normal(encodings.shape, dtype=np.float32)
+    return encodings, identity_ids
+
+
+def benchmark_known_index(sizes, num_queries=200, k=5, nprobes=(1, 4, 16), seed=0):
+    from face_index import ExactIndex, IVFIndex
+
+    rng = np.random.default_rng(seed + 1)
+    print(f"📊 Known-face index ({num_queries} queries, top-{k}):")
+    print(
+        f"   {'size':>9} {'backend':<10} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'batch ms':>9} {'recall@k':>9} {'top-1':>6}"
+    )
+    results = {}
+    for size in sizes:
+        encodings, identity_ids = synthetic_encodings(size, seed=seed)
+        queries = encodings[rng.choice(size, num_queries)]
+        queries = queries + 0.03 * rng.standard_normal(queries.shape, dtype=np.float32)
+
+        # Built one at a time so the 1M case fits in memory next to its inputs.
+        builders = [("exact", ExactIndex, [{}]), ("ivf", IVFIndex, [])]
+        builders[1][2].extend({"nprobe": nprobe} for nprobe in nprobes)
+        reference = None
+        for backend, index_cls, search_settings in builders:
+            start = time.perf_counter()
+            index = index_cls()
+            index.add(encodings, identity_ids)
+            build_sec = time.perf_counter() - start
+            for search_kwargs in search_settings:
+                name = (
+                    f"{backend}/{search_kwargs['nprobe']}" if search_kwargs else backend
+                )
+                result = measure_index(index, queries, k, search_kwargs, reference)
+                if reference is None:
+                    reference = result.pop("neighbours")
+                result.pop("neighbours", None)
+                result["build_sec"] = build_sec
+                results[(size, name)] = result
+                print(
+                    f"   {size:>9} {name:<10} {build_sec:>8.2f} {result['p50_ms']:>8.2f} "
+                    f"{result['p95_ms']:>8.2f} {result['batch_ms']:>9.1f} "
+                    f"{result['recall']:>9.3f} {result['top1']:>6.3f}"
+                )
+            del index
+        del encodings, identity_ids
+    return results
+
+
+def measure_index(index, queries, k, search_kwargs, reference=None):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, k=k, **search_kwargs)
+        samples.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    distances, ids = index.search(queries, k=k, **search_kwargs)
+    batch_ms = (time.perf_counter() - start) * 1000
+    if reference is None:
+        reference = distances, ids
+    # A hit is any returned neighbour at least as close as the exact k-th one.
+    kth = reference[0][:, -1:] + 1e-5
+    p50, p95 = percentiles_ms(samples)
+    return {
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "batch_ms": batch_ms,
+        "recall": np.mean(np.sum(distances <= kth, axis=1) / k),
+        "top1": np.mean(ids[:, 0] == reference[1][:, 0]),
+        "neighbours": (distances, ids),
+    }
+
+
+def load_images(folder, max_images=None):
+    files = ImageDirSource(folder).files[:max_images]
+    names, images = [], []
+    for path in files:
+        image = cv2.imread(path)
+        if image is not None:
+            names.append(os.path.basename(path))
+            images.append(image)
+    return names, images
+
+
+def load_face_annotations(path):
+    # CSV with a header and rows of: image file name, top, right, bottom, left.
+    boxes = {}
+    with open(path, "r") as f:
+        for row in csv.DictReader(f):
+            box = tuple(int(row[k]) for k in ("top", "right", "bottom", "left"))
+            boxes.setdefault(row["image"], []).append(box)
+    return boxes
+
+
+def match_boxes(found, expected, iou_threshold=0.4):
+    # Greedy one-to-one matching, returns the number of expected boxes found.
+    from face_tracker import box_iou
+
+    pairs = sorted(
+        (
+            (box_iou(f, e), i, j)
+            for i, f in enumerate(found)
+            for j, e in enumerate(expected)
+        ),
+        reverse=True,
+    )
+    used_found, used_expected = set(), set()
+    for iou, i, j in pairs:
+        if iou < iou_threshold:
+            break
+        if i not in used_found and j not in used_expected:
+            used_found.add(i)
+            used_expected.add(j)
+    return len(used_expected)
+
+
+def benchmark_detectors(names, images, backends, annotations=None, reference="hog"):
+    """
+    Throughput and recall of each detector backend on `images`. Without
+    annotations the `reference` backend's detections, at full scale with one
+    upsample, stand in for the ground truth.
+    """
+    from detectors import make_detector
+    from utils import locate_faces
+
+    if annotations is None:
+        print(f"⚠️ No annotations, using {reference} at full scale as ground truth")
+        truth_detector = (reference, {"scale": 1.0})
+        truth = [locate_faces(image, truth_detector) for image in images]
+    else:
+        truth = [annotations.get(name, []) for name in names]
+    num_faces = sum(len(boxes) for boxes in truth)
+
+    results = {}
+    for backend in backends:
+        try:
+            make_detector(backend)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"⚠️ Skipping {backend}: {e}")
+            continue
+        locate_faces(images[0], (backend, {}))  # warm-up
+        samples, found_faces, detections = [], 0, 0
+        for image, expected in zip(images, truth):
+            start = time.perf_counter()
+            found = locate_faces(image, (backend, {}))
+            samples.append(time.perf_counter() - start)
+            found_faces += match_boxes(found, expected)
+            detections += len(found)
+        p50, p95 = percentiles_ms(samples)
+        results[backend] = {
+            "fps": len(images) / sum(samples),
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "recall": found_faces / num_faces if num_faces else float("nan"),
+            "extra": detections - found_faces,
+        }
+
+    print(f"📊 Face detectors ({len(images)} images, {num_faces} faces):")
+    print(
+        f"   {'backend':<8} {'fps':>7} {'p50 ms':>8} {'p95 ms':>8} {'recall':>7} {'extra':>6}"
+    )
+    for backend, r in results.items():
+        print(
+            f"   {backend:<8} {r['fps']:>7.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+            f"{r['recall']:>7.3f} {r['extra']:>6}"
+        )
+    return results
+
+
+def synthetic_face_frames(num_frames, fps=30, speed=3, size=(480, 640), seed=0):
+    # A textured square drifting across a noisy background, with its box.
+    rng = np.random.default_rng(seed)
+    height, width = size
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    face = rng.integers(0, 255, (120, 100, 3), dtype=np.uint8)
+    start = datetime.datetime.now()
+    for i in range(num_frames):
+        frame = cv2.GaussianBlur(background, (5, 5), 0)
+        left = 50 + (i * speed) % (width - 200)
+        top = 100
+        frame[top : top + 120, left : left + 100] = face
+        timestamp = start + datetime.timedelta(seconds=i / fps)
+        yield frame, timestamp, (top, left + 100, top + 120, left)
+
+
+def benchmark_tracker(num_frames=300, detect_every=5, drop_rates=(0.0, 0.5, 0.8)):
+    """
+    Detections per processed frame of FaceTrackManager when the pipeline
+    drops a share of the frames. The detector is the synthetic ground truth,
+    so only the detect/follow schedule is measured. Raises when the tracker
+    falls back to detecting every frame.
+    """
+    from face_tracker import FaceTrackManager, tracking_gray
+
+    rng = np.random.default_rng(1)
+    print(f"📊 Face tracker ({num_frames} frames, detect every {detect_every}):")
+    print(f"   {'dropped':>8} {'frames':>7} {'detections':>11} {'encodes':>8}")
+    results = {}
+    for drop_rate in drop_rates:
+        tracker = FaceTrackManager(detect_every=detect_every)
+        for frame, timestamp, box in synthetic_face_frames(num_frames):
+            if rng.random() < drop_rate:
+                continue
+            gray = tracking_gray(frame)
+            if tracker.should_detect(timestamp):
+                tracker.update([box], gray, timestamp)
+            else:
+                tracker.follow(gray, timestamp)
+        stats = tracker.stats()
+        results[drop_rate] = stats
+        print(
+            f"   {drop_rate:>8.0%} {stats['frames']:>7} {stats['detections']:>11} "
+            f"{stats['encodes']:>8}"
+        )
+        if stats["frames"] > detect_every and stats["detections"] >= stats["frames"]:
+            raise RuntimeError(
+                f"Tracker detected on every frame with {drop_rate:.0%} dropped"
+            )
+    return results
+
+
+def synthetic_scene(size=(720, 1280), seed=0):
+    # A large static scene of gradients and blurred blobs.
+    rng = np.random.default_rng(seed)
+    height, width = size
+    y, x = np.mgrid[0:height, 0:width]
+    scene = np.stack(
+        [
+            x / width * 120 + 60,
+            y / height * 80 + 90,
+            x * y / (width * height) * 100 + 50,
+        ],
+        axis=-1,
+    )
+    for _ in range(25):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        color = [float(c) for c in rng.integers(0, 255, 3)]
+        cv2.circle(scene, center, int(rng.integers(20, 120)), color, -1)
+    return cv2.GaussianBlur(scene.astype(np.uint8), (0, 0), 3)
+
+
+def benchmark_caption_cache(num_frames=50, noise=3.0, seed=0):
+    """
+    Hit rate of the caption cache on a static scene with sensor noise, and
+    whether a person entering the scene at different places misses it.
+    Raises when the empty-scene caption would be reused for a person.
+    """
+    from caption import CaptionCache, frame_signature
+
+    rng = np.random.default_rng(seed)
+    scene = synthetic_scene(seed=seed)
+    height, width = scene.shape[:2]
+
+    def with_noise(frame):
+        noisy = frame + rng.normal(0, noise, frame.shape)
+        return np.clip(noisy, 0, 255).astype(np.uint8)
+
+    cache = CaptionCache()
+    cache.add(frame_signature(scene), "an empty room")
+    for _ in range(num_frames):
+        cache.lookup(frame_signature(with_noise(scene)))
+    static_hits = cache.hits
+
+    reused = []
+    for left in np.linspace(0, width - 100, 6).astype(int).tolist():
+        top = int(rng.integers(height // 4, height // 2))
+        person = scene.copy()
+        cv2.rectangle(person, (left, top), (left + 90, top + 300), (40, 40, 60), -1)
+        cv2.circle(person, (left + 45, top - 30), 35, (150, 170, 200), -1)
+        if cache.lookup(frame_signature(with_noise(person))) is not None:
+            reused.append((left, top))
+
+    print(f"📊 Caption cache ({num_frames} noisy static frames, noise {noise}):")
+    print(f"   static hit rate {static_hits / num_frames:.3f}")
+    print(f"   person frames reusing the empty-scene caption: {len(reused)} of 6")
+    if reused:
+        raise RuntimeError(f"Cached caption reused with a person at {reused}")
+    return {"static_hit_rate": static_hits / num_frames, "person_hits": len(reused)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Security System benchmarks.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    caption_parser = subparsers.add_parser(
+        "caption", help="latency and caption agreement of the caption backends"
+    )
+    caption_parser.add_argument(
+        "source", help="video file, image folder or 'synthetic'"
+    )
+    caption_parser.add_argument("--max-frames", type=int, default=20)
+    caption_parser.add_argument(
+        "--backends", nargs="+", default=["eager", "int8", "torchscript", "onnx"]
+    )
+    caption_parser.add_argument("--decoding", default="greedy")
+    caption_parser.add_argument("--max-length", type=int, default=30)
+
+    index_parser = subparsers.add_parser(
+        "index", help="recall and latency of the known-face index backends"
+    )
+    index_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 100000, 1000000]
+    )
+    index_parser.add_argument("--queries", type=int, default=200)
+    index_parser.add_argument("--k", type=int, default=5)
+    index_parser.add_argument("--nprobes", type=int, nargs="+", default=[1, 4, 16])
+
+    detectors_parser = subparsers.add_parser(
+        "detectors", help="throughput and recall of the face detector backends"
+    )
+    detectors_parser.add_argument("images", help="folder of images with faces")
+    detectors_parser.add_argument("--max-images", type=int, default=None)
+    detectors_parser.add_argument(
+        "--backends", nargs="+", default=["hog", "res10", "yunet", "haar"]
+    )
+    detectors_parser.add_argument(
+        "--annotations",
+        default=None,
+        help="CSV of image,top,right,bottom,left face boxes used as ground truth",
+    )
+    detectors_parser.add_argument("--reference", default="hog")
+
+    cache_parser = subparsers.add_parser(
+        "caption-cache", help="caption cache hits on a static scene and a new person"
+    )
+    cache_parser.add_argument("--frames", type=int, default=50)
+    cache_parser.add_argument("--noise", type=float, default=3.0)
+
+    tracker_parser = subparsers.add_parser(
+        "tracker", help="detections per frame of the face tracker with dropped frames"
+    )
+    tracker_parser.add_argument("--frames", type=int, default=300)
+    tracker_parser.add_argument("--detect-every", type=int, default=5)
+    tracker_parser.add_argument(
+        "--drop-rates", type=float, nargs="+", default=[0.0, 0.5, 0.8]
+    )
+
+    args = parser.parse_args()
+    if args.command == "detectors":
+        names, images = load_images(args.images, args.max_images)
+        annotations = (
+            load_face_annotations(args.annotations) if args.annotations else None
+        )
+        benchmark_detectors(
+            names, images, args.backends, annotations, reference=args.reference
+        )
+    elif args.command == "caption-cache":
+        benchmark_caption_cache(args.frames, args.noise)
+    elif args.command == "tracker":
+        benchmark_tracker(args.frames, args.detect_every, args.drop_rates)
+    elif args.command == "index":
+        benchmark_known_index(
+            args.sizes, num_queries=args.queries, k=args.k, nprobes=args.nprobes
+        )
+    elif args.command == "caption":
+        frames = load_frames(args.source, args.max_frames)
+        benchmark_caption_backends(
+            frames, args.backends, decoding=args.decoding, max_length=args.max_length
+        )
+
+
+if __name__ == "__main__":
+    main()
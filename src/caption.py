@@ -0,0 +1,251 @@
+import threading
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+from metrics import METRICS
+
+CAPTION_BACKENDS = ("eager", "int8", "torchscript", "onnx")
+
+DECODING_PROFILES = {
+    "nucleus": dict(use_nucleus_sampling=True),
+    "greedy": dict(use_nucleus_sampling=False, num_beams=1),
+    "beam": dict(use_nucleus_sampling=False, num_beams=3),
+}
+
+
+class LazyCaptionHandler:
+    """
+    Loads the caption model on a background thread so torch/lavis are neither
+    imported nor initialized on the startup path. generate_caption() returns
+    None until the model is ready.
+    """
+
+    def __init__(self, **caption_settings):
+        self.caption_settings = caption_settings
+        self.caption_handler = None
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.load, daemon=True)
+        self.thread.start()
+
+    def load(self):
+        start = time.time()
+        try:
+            from caption_model import CaptionHandler
+
+            self.caption_handler = CaptionHandler(**self.caption_settings)
+            print(f"✅ Caption model ready in {round(time.time() - start, 2)} sec")
+        except Exception as e:
+            print(f"❌ Failed to load caption model: {e}")
+        self.ready.set()
+
+    def is_ready(self):
+        return self.caption_handler is not None
+
+    def wait(self, timeout=None):
+        self.ready.wait(timeout)
+        return self.is_ready()
+
+    def generate_caption(self, image):
+        if self.caption_handler is None:
+            return None
+        return self.caption_handler.generate_caption(image)
+
+
+def frame_signature(image, grid=4, hash_size=8, margin=2):
+    # Difference hash of every cell of a grid x grid split of the frame: 64
+    # bits per cell telling whether each pixel of a tiny grayscale thumbnail
+    # of the cell is brighter than its right neighbour by more than `margin`
+    # levels, so sensor noise in flat areas does not flip bits. Per cell, a
+    # person entering a large static scene still flips many bits of theirs.
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    small = cv2.resize(
+        gray,
+        (grid * (hash_size + 1), grid * hash_size),
+        interpolation=cv2.INTER_AREA,
+    )
+    signature = []
+    for row in range(grid):
+        for col in range(grid):
+            cell = small[
+                row * hash_size : (row + 1) * hash_size,
+                col * (hash_size + 1) : (col + 1) * (hash_size + 1),
+            ]
+            bits = (cell[:, 1:] > cell[:, :-1] + margin).flatten()
+            signature.append(int("".join("1" if bit else "0" for bit in bits), 2))
+    return tuple(signature)
+
+
+def signature_distance(a, b):
+    """Largest number of differing bits in any cell of two frame signatures."""
+    return max((x ^ y).bit_count() for x, y in zip(a, b))
+
+
+class CaptionCache:
+    """
+    Bounded LRU of recent frame signatures and their captions.
+
+    A frame whose signature is within `max_distance` bits of a cached one in
+    every grid cell (see frame_signature), and that is younger than `ttl_sec`,
+    reuses that caption instead of running BLIP.
+    """
+
+    def __init__(self, max_size=32, ttl_sec=300, max_distance=2):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.max_distance = max_distance
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, signature):
+        now = time.time()
+        with self.lock:
+            best, best_distance = None, self.max_distance + 1
+            for cached_signature, (caption, created) in list(self.entries.items()):
+                if now - created > self.ttl_sec:
+                    del self.entries[cached_signature]
+                    continue
+                distance = signature_distance(cached_signature, signature)
+                if distance < best_distance:
+                    best, best_distance = cached_signature, distance
+            caption = None
+            if best is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(best)
+                self.hits += 1
+                caption = self.entries[best][0]
+        METRICS.inc(
+            "caption_cache_lookups_total", result="miss" if best is None else "hit"
+        )
+        return caption
+
+    def add(self, signature, caption):
+        with self.lock:
+            self.entries[signature] = (caption, time.time())
+            self.entries.move_to_end(signature)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio(), 3),
+            "size": len(self.entries),
+        }
+
+
+class CaptionWorker:
+    """
+    Captions frames on a background thread so the frame loop never waits on BLIP.
+
+    submit() never blocks: only the most recent pending frame is kept and older
+    pending jobs are replaced. latest() returns the newest finished caption and
+    staleness() how old the frame it describes is.
+    """
+
+    def __init__(self, caption_handler, labels=None, cache=None):
+        self.caption_handler = caption_handler
+        self.cache = cache
+        self.labels = labels or {}
+        self.condition = threading.Condition()
+        self.pending = None
+        self.caption = ""
+        self.caption_frame_time = None
+        self.submitted = 0
+        self.replaced = 0
+        self.completed = 0
+        self.running = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        METRICS.add_collector(self.publish_metrics)
+        return self
+
+    def submit(self, frame):
+        with self.condition:
+            replaced = self.pending is not None
+            if replaced:
+                self.replaced += 1
+            self.pending = (frame, time.time())
+            self.submitted += 1
+            self.condition.notify()
+        METRICS.inc("caption_jobs_submitted_total", **self.labels)
+        if replaced:
+            METRICS.inc("caption_jobs_replaced_total", **self.labels)
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.pending is not None or not self.running
+                )
+                if not self.running:
+                    return
+                frame, frame_time = self.pending
+                self.pending = None
+            try:
+                caption = self.get_caption(frame)
+            except Exception as e:
+                print(f"❌ Caption failed: {e}")
+                continue
+            if caption is None:
+                continue
+            with self.condition:
+                self.caption = caption
+                self.caption_frame_time = frame_time
+                self.completed += 1
+            METRICS.inc("caption_jobs_completed_total", **self.labels)
+
+    def is_ready(self):
+        is_ready = getattr(self.caption_handler, "is_ready", None)
+        return is_ready() if is_ready is not None else True
+
+    def get_caption(self, frame):
+        if not self.is_ready():
+            return None
+        if self.cache is None:
+            return self.caption_handler.generate_caption(frame)
+        signature = frame_signature(frame)
+        caption = self.cache.lookup(signature)
+        if caption is None:
+            caption = self.caption_handler.generate_caption(frame)
+            self.cache.add(signature, caption)
+        return caption
+
+    def latest(self):
+        return self.caption
+
+    def staleness(self):
+        if self.caption_frame_time is None:
+            return None
+        return time.time() - self.caption_frame_time
+
+    def publish_metrics(self):
+        staleness = self.staleness()
+        if staleness is not None:
+            METRICS.set_gauge("caption_staleness_seconds", staleness, **self.labels)
+        if self.cache is not None:
+            METRICS.set_gauge(
+                "caption_cache_hit_ratio", self.cache.hit_ratio(), **self.labels
+            )
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        METRICS.remove_collector(self.publish_metrics)
+        if self.thread.is_alive():
+            self.thread.join(timeout=30)
+        if self.cache is not None:
+            print(f"📊 Caption cache: {self.cache.stats()}")
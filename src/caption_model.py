@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+import cv2
+
+from metrics import METRICS
+from caption import DECODING_PROFILES, CAPTION_BACKENDS
+
+from lavis.models import load_model_and_preprocess
+import torch
+from PIL import Image
+
+BLIP_MODEL = ("blip_caption", "base_coco")
+BLIP_IMAGE_SIZE = 384
+ONNX_OPSET = 17
+EXPORT_DIR = "data/models"
+
+
+def weights_fingerprint(module):
+    # Short hash of the weights, so a changed checkpoint gets its own export.
+    digest = hashlib.sha256()
+    for name, tensor in module.state_dict().items():
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:12]
+
+
+def export_path(export_dir, features, ext, **settings):
+    """
+    Path of an exported visual encoder, named after everything the exported
+    graph depends on: model, checkpoint weights, image size, torch version and
+    export settings. Anything else changing gives a new file instead of a
+    stale graph.
+    """
+    parts = [
+        *BLIP_MODEL,
+        "visual",
+        f"{BLIP_IMAGE_SIZE}px",
+        f"torch{torch.__version__}",
+        *(f"{key}{value}" for key, value in sorted(settings.items())),
+        weights_fingerprint(features),
+    ]
+    name = "_".join(parts).replace("+", "-").replace("/", "-")
+    return os.path.join(export_dir, f"{name}.{ext}")
+
+
+class VisualFeatures(torch.nn.Module):
+    # Exposes forward_features() as forward() so the encoder can be traced/exported.
+    def __init__(self, visual_encoder):
+        super().__init__()
+        self.visual_encoder = visual_encoder
+
+    def forward(self, image):
+        return self.visual_encoder.forward_features(image)
+
+
+class ExportedVisualEncoder(torch.nn.Module):
+    # Stands in for model.visual_encoder, BlipCaption only calls forward_features().
+    def __init__(self, run_fn):
+        super().__init__()
+        self.run_fn = run_fn
+
+    def forward_features(self, image):
+        return self.run_fn(image)
+
+
+class CaptionHandler:
+    """
+    BLIP captioner with a selectable CPU inference backend:
+
+    - eager: fp32 PyTorch, as loaded by LAVIS
+    - int8: dynamic int8 quantization of every nn.Linear
+    - torchscript: traced and frozen vision encoder
+    - onnx: vision encoder exported to ONNX and run with onnxruntime
+
+    `decoding` is one of DECODING_PROFILES; `num_captions` and `max_length`
+    are passed on to model.generate() and the first caption is returned.
+    """
+
+    def __init__(
+        self,
+        backend="eager",
+        decoding="nucleus",
+        num_captions=1,
+        max_length=30,
+        export_dir=EXPORT_DIR,
+    ):
+        if backend not in CAPTION_BACKENDS:
+            raise ValueError(f"Unknown caption backend: {backend}")
+        if decoding not in DECODING_PROFILES:
+            raise ValueError(f"Unknown caption decoding: {decoding}")
+        self.generate_kwargs = dict(
+            DECODING_PROFILES[decoding],
+            num_captions=num_captions,
+            max_length=max_length,
+        )
+        num_beams = self.generate_kwargs.get("num_beams")
+        if num_beams is not None and num_captions > num_beams:
+            raise ValueError(
+                f"{decoding} decoding returns at most {num_beams} captions, got num_captions={num_captions}"
+            )
+
+        self.backend = backend
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model, self.vis_processors, self.txt_processors = (
+            load_model_and_preprocess(
+                # name="blip2",
+                # model_type="coco",
+                name=BLIP_MODEL[0],
+                model_type=BLIP_MODEL[1],
+                is_eval=True,
+                device="cpu",
+            )
+        )
+        self.prepare_backend(export_dir)
+        # One model may be shared by several cameras (see supervisor.py).
+        self.lock = threading.Lock()
+
+    def prepare_backend(self, export_dir):
+        if self.backend == "eager":
+            return
+        if self.backend == "int8":
+            self.model = torch.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            return
+
+        os.makedirs(export_dir, exist_ok=True)
+        features = VisualFeatures(self.model.visual_encoder).eval()
+        example = torch.randn(1, 3, BLIP_IMAGE_SIZE, BLIP_IMAGE_SIZE)
+        if self.backend == "torchscript":
+            path = export_path(export_dir, features, "pt")
+            if os.path.exists(path):
+                traced = torch.jit.load(path)
+            else:
+                with torch.no_grad():
+                    traced = torch.jit.trace(features, example)
+                traced.save(path)
+            traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+            self.model.visual_encoder = ExportedVisualEncoder(traced)
+        elif self.backend == "onnx":
+            try:
+                import onnxruntime
+            except ImportError:
+                raise ImportError("The onnx caption backend requires onnxruntime")
+            path = export_path(export_dir, features, "onnx", opset=ONNX_OPSET)
+            if not os.path.exists(path):
+                with torch.no_grad():
+                    torch.onnx.export(
+                        features,
+                        example,
+                        path,
+                        input_names=["image"],
+                        output_names=["image_embeds"],
+                        opset_version=ONNX_OPSET,
+                    )
+            session = onnxruntime.InferenceSession(
+                path, providers=["CPUExecutionProvider"]
+            )
+            self.model.visual_encoder = ExportedVisualEncoder(
+                lambda image: torch.from_numpy(
+                    session.run(None, {"image": image.cpu().numpy()})[0]
+                )
+            )
+
+    @METRICS.timed("caption_seconds")
+    def generate_caption(self, image):
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        pil_image = Image.fromarray(image_rgb)
+        pil_image = self.vis_processors["eval"](pil_image).unsqueeze(0).to(self.device)
+        with self.lock, torch.no_grad():
+            caption = self.model.generate({"image": pil_image}, **self.generate_kwargs)
+        print(caption)
+        return caption[0]
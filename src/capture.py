@@ -0,0 +1,250 @@
+import os
+import time
+import threading
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class CameraSource:
+    live = True
+
+    def __init__(
+        self, address=0, width=None, height=None, fourcc=None, buffer_size=1, fps=None
+    ):
+        self.address = address
+        self.cap = cv2.VideoCapture(address)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open camera: {address}")
+        # FOURCC has to be negotiated before the resolution on most V4L2 devices.
+        if fourcc:
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        if width:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            self.cap.set(cv2.CAP_PROP_FPS, fps)
+        if buffer_size:
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or None
+        print(f"✅ Camera {address} negotiated: {self.settings()}")
+
+    def settings(self):
+        fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+        return {
+            "width": int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": self.fps,
+            "fourcc": "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)),
+            "buffer_size": int(self.cap.get(cv2.CAP_PROP_BUFFERSIZE)),
+        }
+
+    def read(self):
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource:
+    live = False
+
+    def __init__(self, path):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open video file: {path}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or None
+
+    def read(self):
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirSource:
+    live = False
+
+    def __init__(self, path, fps=None):
+        self.path = path
+        self.files = sorted(
+            os.path.join(path, f)
+            for f in os.listdir(path)
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.files:
+            raise ValueError(f"No images found in: {path}")
+        self.fps = fps
+        self.idx = 0
+
+    def read(self):
+        while self.idx < len(self.files):
+            frame = cv2.imread(self.files[self.idx])
+            self.idx += 1
+            if frame is not None:
+                return True, frame
+            print(f"⚠️ Could not read image: {self.files[self.idx - 1]}")
+        return False, None
+
+    def release(self):
+        pass
+
+
+def moving_box_frames(width=640, height=480, box_size=80):
+    # Static grey scene with a box sweeping across it, enough to trigger motion.
+    x = 0
+    while True:
+        frame = np.full((height, width, 3), 90, dtype=np.uint8)
+        cv2.rectangle(
+            frame,
+            (x, height // 3),
+            (x + box_size, height // 3 + box_size),
+            (230, 230, 230),
+            -1,
+        )
+        x = (x + 8) % max(1, width - box_size)
+        yield frame
+
+
+class SyntheticSource:
+    live = False
+
+    def __init__(self, frames=None, fps=30, max_frames=None):
+        self.frames = iter(frames if frames is not None else moving_box_frames())
+        self.fps = fps
+        self.max_frames = max_frames
+        self.count = 0
+
+    def read(self):
+        if self.max_frames is not None and self.count >= self.max_frames:
+            return False, None
+        try:
+            frame = next(self.frames)
+        except StopIteration:
+            return False, None
+        self.count += 1
+        return True, frame
+
+    def release(self):
+        pass
+
+
+def warn_ignored_settings(path, **settings):
+    # Recorded sources play at their own resolution, and video files at their
+    # own fps, so settings asked for them would be reported but never applied.
+    ignored = {name: value for name, value in settings.items() if value is not None}
+    if ignored:
+        print(f"⚠️ Capture settings {ignored} do not apply to {path}, ignoring them")
+
+
+def open_source(path, fps=None, **camera_settings):
+    if isinstance(path, int) or str(path).isdigit():
+        return CameraSource(int(path), fps=fps, **camera_settings)
+    if path == "synthetic":
+        warn_ignored_settings(path, **camera_settings)
+        return SyntheticSource(fps=fps or 30)
+    if os.path.isdir(path):
+        warn_ignored_settings(path, **camera_settings)
+        return ImageDirSource(path, fps=fps)
+    if os.path.isfile(path):
+        warn_ignored_settings(path, fps=fps, **camera_settings)
+        return VideoFileSource(path)
+    # Anything else (rtsp://, http://) is a network camera.
+    return CameraSource(path, fps=fps, **camera_settings)
+
+
+class FrameGrabber:
+    """
+    Reads `source` continuously on its own thread and only keeps the newest
+    frame, so read() never returns a frame that queued up while downstream
+    stages were busy. Frames overwritten before anyone read them are counted
+    as dropped. Non-live sources are paced to their fps to behave like a camera.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_time = None
+        self.frame_id = 0
+        self.last_read_id = 0
+        self.grabbed = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.exhausted = False
+        self.running = False
+        self.thread = threading.Thread(target=self.grab_loop, daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        return self
+
+    def grab_loop(self):
+        pace = not self.source.live and self.source.fps
+        interval = 1.0 / self.source.fps if pace else 0.0
+        try:
+            while self.running:
+                start = time.perf_counter()
+                ret, frame = self.source.read()
+                if not ret:
+                    break
+                with self.condition:
+                    if self.frame_id > self.last_read_id:
+                        self.dropped += 1
+                    self.frame = frame
+                    self.frame_time = time.time()
+                    self.frame_id += 1
+                    self.grabbed += 1
+                    self.condition.notify_all()
+                if interval:
+                    remaining = interval - (time.perf_counter() - start)
+                    if remaining > 0:
+                        time.sleep(remaining)
+        except Exception as e:
+            print(f"❌ Error while grabbing frames: {e}")
+        finally:
+            # Readers must never wait on a dead grab thread.
+            with self.condition:
+                self.exhausted = True
+                self.condition.notify_all()
+
+    def has_new_frame(self):
+        return self.frame_id > self.last_read_id
+
+    def read(self, timeout=10.0):
+        """Newest unread frame, (False, None) when the source ended or stalled for `timeout` sec."""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.has_new_frame() or self.exhausted or not self.running,
+                timeout=timeout,
+            )
+            if not self.has_new_frame():
+                if not self.exhausted and self.running:
+                    print(f"⚠️ No frame from the source for {timeout} sec")
+                return False, None
+            self.last_read_id = self.frame_id
+            self.delivered += 1
+            return True, self.frame
+
+    def frame_age(self):
+        return time.time() - self.frame_time if self.frame_time else 0.0
+
+    def stats(self):
+        return {
+            "grabbed": self.grabbed,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+    def release(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
+        self.source.release()
+        print(f"📷 Grabber stats: {self.stats()}")
@@ -8,12 +8,16 @@ from entities.building import Building
 from entities.alarm import Alarm
 from entities.uknown import Unknown
 from entities.unknown_face_encoding import UnknownFaceEncoding
-from utils import get_face_encodings, NULL_ENCODING, generate_id
+from utils import encode_image_file, generate_id
 from unknown import UnknownPerson
+from face_index import PersonEncodingArena
 from alert import Alert
 import os
+from metrics import instrument_methods
+from encoding_cache import default_encoding_cache
 
 
+@instrument_methods("db")
 class DBInterface:
     def createCameraAdmin(self, name, surname, email, phone):
         camera_admin = CameraAdmin(name, surname, email, phone)
@@ -30,6 +34,11 @@ class DBInterface:
         print(f"Camera created: {str(camera)}")
         return camera
 
+    def get_cameras_on_building_id(self, building_id):
+        cameras = Camera.get_rows_on_building_id(building_id)
+        print(f"Found {len(cameras)} cameras for building {building_id}")
+        return cameras
+
     def relate_camera_admin_to_camera(self, camera_id, admin_id):
         relation = Camera2Admin(camera_id, admin_id)
         print(f"Relation created: {str(relation)}")
@@ -65,7 +74,10 @@ class DBInterface:
     #     print(f"Known Face Encoding created: {str(known_face_encoding)}")
     #     return known_face_encoding
 
-    def createKnownFaceEncodings(self, known_face_id, img_folder_path):
+    def createKnownFaceEncodings(
+        self, known_face_id, img_folder_path, encoding_cache=None
+    ):
+        encoding_cache = encoding_cache or default_encoding_cache()
         files = os.listdir(img_folder_path)
         files = [
             f
@@ -75,10 +87,25 @@ class DBInterface:
         known_face_encodings = []
         for file in files:
             img_path = os.path.join(img_folder_path, file)
-            encoding = get_face_encodings(img_path)
+            try:
+                # Errors raise before anything is cached, so they are retried.
+                encoding = encoding_cache.get_or_compute(img_path, encode_image_file)
+            except Exception as e:
+                print(f"❌ Error during face encoding for {img_path}: {e}")
+                encoding = None
             known_face_encoding = KnownFaceEncoding(known_face_id, encoding, img_path)
             print(f"Known Face Encoding created: {str(known_face_encoding)}")
             known_face_encodings.append(known_face_encoding)
+        print(f"📊 Encoding cache: {encoding_cache.stats()}")
+        return known_face_encodings
+
+    def createKnownFaceEncodingsBulk(self, known_face_id_img_path_encodings):
+        known_face_encodings = [
+            KnownFaceEncoding(known_face_id, encoding, img_path, save=False)
+            for known_face_id, img_path, encoding in known_face_id_img_path_encodings
+        ]
+        KnownFaceEncoding.save_many(known_face_encodings)
+        print(f"Known Face Encodings created: {len(known_face_encodings)}")
         return known_face_encodings
 
     def createAlarm(
@@ -127,6 +154,10 @@ class DBInterface:
         print(f"Unknown Face Encoding created: {str(unknown_face_encoding)}")
         return unknown_face_encoding
 
+    def deleteUnknownFaceEncoding(self, id):
+        UnknownFaceEncoding.delete_on_id(id)
+        print(f"Unknown Face Encoding {id} deleted")
+
     def mv_uknowns_to_knowns(self, alarm_id, camera_id):
         unknowns = Unknown.get_rows_on_alarm_id(alarm_id)
         for unknown in unknowns:
@@ -158,15 +189,16 @@ class DBInterface:
                 UnknownFaceEncoding.delete_on_id(enc_id)
                 print(f"Unknown Face Encoding {enc_id} is being deleted")
 
-    def get_known_faces_name_encodings(self, camera_id):
-        encoding_2_name = {}
+    def get_known_faces_id_name_encodings(self, camera_id):
+        # (known_face_id, display_name, encoding) for every known face encoding.
+        rows = []
         known_faces = KnownFace.get_rows_on_camera_id(camera_id)
         for known_face in known_faces:
             encodings = KnownFaceEncoding.get_encodings_on_known_face_id(known_face.id)
             for encoding in encodings:
-                encoding_2_name[tuple(encoding.flatten())] = known_face.display_name
+                rows.append((known_face.id, known_face.display_name, encoding))
 
-        return {}  # encoding_2_name
+        return []  # rows
 
     def get_pending_alarm_ids(self, camera_id):
         pendings_alarms = Alarm.get_pending_alarms_rows_on_camera_id(camera_id)
@@ -178,7 +210,7 @@ class DBInterface:
         alarm_ids = [alarm.id for alarm in pendings_alarms]
         return alarm_ids
 
-    def get_latest_alarm_info(self, camera_id, max_enc_per_person=5):
+    def get_latest_alarm_info(self, camera_id, max_enc_per_person=5, max_unknowns=10):
 
         pendings_alarms = Alarm.get_pending_alarms_rows_on_camera_id(camera_id)
         active_alarms = Alarm.get_active_alarms_rows_on_camera_id(camera_id)
@@ -195,12 +227,14 @@ class DBInterface:
 
         unknowns = Unknown.get_rows_on_alarm_id(max_alarm.id)
         unknown_people = []
-        all_padded_encodings = []
+        alert_encodings = PersonEncodingArena(
+            max(max_unknowns, len(unknowns)), max_enc_per_person
+        )
         for unknown in unknowns:
-            unknown_encodings = UnknownFaceEncoding.get_encodings_on_unknown_face_id(
+            rows = UnknownFaceEncoding.get_encodings_ids_img_paths_on_unknown_face_id(
                 unknown.id
-            )
-            unknown_encodings = unknown_encodings[:max_enc_per_person]
+            )[:max_enc_per_person]
+            unknown_encodings = [encoding for _, encoding, _ in rows]
             unkown_person = UnknownPerson(
                 encodings=unknown_encodings,
                 first_seen=unknown.first_time_seen,
@@ -210,20 +244,17 @@ class DBInterface:
                 alerted=True,
                 all_encodings_saved=True,
                 all_img_saved=True,
-                img_paths=[None] * len(unknown_encodings),
+                img_paths=[img_path for _, _, img_path in rows],
+                row_ids=[row_id for row_id, _, _ in rows],
             )
-            unknown_people.append(unkown_person)
-            padded_encodings = (
-                unknown_encodings
-                if len(unknown_encodings) == max_enc_per_person
-                else unknown_encodings
-                + [NULL_ENCODING] * (max_enc_per_person - len(unknown_encodings))
+            unkown_person.slot = alert_encodings.add_person(
+                unkown_person, unknown_encodings
             )
-            all_padded_encodings.extend(padded_encodings)
+            unknown_people.append(unkown_person)
         alert = Alert(
             id=max_alarm.id,
             unknown_ids=set([unknown.id for unknown in unknown_people]),
-            unknown_encodings=all_padded_encodings,
+            unknown_encodings=alert_encodings,
             unknowns=unknown_people,
             update_time=max_alarm.update_time,
             start_time=max_alarm.start_date_time,
@@ -283,7 +314,7 @@ def main():
     )
 
     # Get known faces encodings
-    # encoding_2_name = db.get_known_faces_name_encodings(camera_id=0)
+    # encoding_2_name = db.get_known_faces_id_name_encodings(camera_id=0)
     # print("Known Faces Encodings:")
     # for encoding, name in encoding_2_name.items():
     #     print(f"Name: {name}, Encoding: {encoding[:3]}")
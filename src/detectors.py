@@ -0,0 +1,153 @@
+import os
+import cv2
+
+DETECTOR_BACKENDS = ("hog", "res10", "yunet", "haar")
+DETECTOR_MODELS_FOLDER = "data/models/face_detection"
+
+
+def xywh_to_box(x, y, w, h, width, height):
+    # (x, y, w, h) -> (top, right, bottom, left) clipped to the image.
+    return (
+        max(0, int(y)),
+        min(width, int(x + w)),
+        min(height, int(y + h)),
+        max(0, int(x)),
+    )
+
+
+class HogDetector:
+    """dlib HOG + linear SVM through face_recognition, the original detector."""
+
+    def __init__(self, scale=0.5, upsample=1):
+        self.scale = scale
+        self.upsample = upsample
+
+    def detect(self, image):
+        import face_recognition
+
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return face_recognition.face_locations(rgb_image, self.upsample, model="hog")
+
+
+class Res10Detector:
+    """OpenCV DNN ResNet-10 SSD, from the local Caffe prototxt and weights."""
+
+    def __init__(
+        self,
+        scale=1.0,
+        confidence=0.5,
+        prototxt=os.path.join(DETECTOR_MODELS_FOLDER, "deploy.prototxt"),
+        weights=os.path.join(
+            DETECTOR_MODELS_FOLDER, "res10_300x300_ssd_iter_140000.caffemodel"
+        ),
+    ):
+        for path in (prototxt, weights):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"res10 model file not found: {path}")
+        self.scale = scale
+        self.confidence = confidence
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+
+    def detect(self, image):
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(
+            cv2.resize(image, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0)
+        )
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self.confidence]
+        boxes = []
+        for x1, y1, x2, y2 in detections[:, 3:7] * [width, height, width, height]:
+            box = xywh_to_box(x1, y1, x2 - x1, y2 - y1, width, height)
+            if box[1] > box[3] and box[2] > box[0]:
+                boxes.append(box)
+        return boxes
+
+
+class YuNetDetector:
+    """OpenCV FaceDetectorYN (YuNet), from the local ONNX model."""
+
+    def __init__(
+        self,
+        scale=0.5,
+        confidence=0.7,
+        nms_threshold=0.3,
+        model=os.path.join(DETECTOR_MODELS_FOLDER, "face_detection_yunet_2023mar.onnx"),
+    ):
+        if not os.path.exists(model):
+            raise FileNotFoundError(f"YuNet model file not found: {model}")
+        self.scale = scale
+        self.detector = cv2.FaceDetectorYN.create(
+            model, "", (320, 320), confidence, nms_threshold
+        )
+
+    def detect(self, image):
+        height, width = image.shape[:2]
+        self.detector.setInputSize((width, height))
+        _, faces = self.detector.detect(image)
+        if faces is None:
+            return []
+        return [xywh_to_box(*face[:4], width, height) for face in faces]
+
+
+class HaarDetector:
+    """OpenCV Viola-Jones cascade: the fastest and least accurate option."""
+
+    def __init__(
+        self,
+        scale=0.5,
+        scale_factor=1.1,
+        min_neighbors=5,
+        min_size=20,
+        cascade=None,
+    ):
+        if not hasattr(cv2, "CascadeClassifier"):
+            raise ImportError("This OpenCV build has no Haar cascades (OpenCV 5)")
+        if cascade is None:
+            cascade = os.path.join(
+                cv2.data.haarcascades, "haarcascade_frontalface_default.xml"
+            )
+        self.scale = scale
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.cascade = cv2.CascadeClassifier(cascade)
+        if self.cascade.empty():
+            raise FileNotFoundError(f"Haar cascade not found: {cascade}")
+
+    def detect(self, image):
+        height, width = image.shape[:2]
+        gray = cv2.equalizeHist(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+        faces = self.cascade.detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=(self.min_size, self.min_size),
+        )
+        return [xywh_to_box(*face, width, height) for face in faces]
+
+
+def make_detector(backend="hog", **settings):
+    if backend == "hog":
+        return HogDetector(**settings)
+    if backend == "res10":
+        return Res10Detector(**settings)
+    if backend == "yunet":
+        return YuNetDetector(**settings)
+    if backend == "haar":
+        return HaarDetector(**settings)
+    raise ValueError(f"Unknown face detector backend: {backend}")
+
+
+# One instance per backend and settings in every process: detectors wrap
+# OpenCV nets that can't be pickled, so pool workers build their own.
+_detectors = {}
+
+
+def get_detector(detector=None):
+    """Cached detector for a (backend, settings) pair, HOG when None."""
+    backend, settings = detector or ("hog", {})
+    key = (backend, tuple(sorted(settings.items())))
+    if key not in _detectors:
+        _detectors[key] = make_detector(backend, **settings)
+    return _detectors[key]
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import tempfile
+import threading
+from importlib import metadata
+import numpy as np
+
+from metrics import METRICS
+
+ENCODING_CACHE_FOLDER = "data/cache/encodings"
+# Part of every key: bump it whenever detector, encoder or jitters change.
+ENCODER_VERSION = "dlib_face_recognition_resnet_model_v1/hog/jitters=1"
+# Their installed versions are part of every key as well, so upgrading the
+# models or dlib does not serve encodings of the old ones.
+ENCODER_PACKAGES = ("dlib", "face_recognition", "face_recognition_models")
+
+
+def installed_encoder_version():
+    versions = []
+    for package in ENCODER_PACKAGES:
+        try:
+            versions.append(f"{package}={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{package}=none")
+    return "/".join([ENCODER_VERSION] + versions)
+
+
+class EncodingCache:
+    """
+    On-disk cache of image encodings keyed by the SHA-256 of the image bytes
+    and the encoder version (ENCODER_VERSION and the installed versions of
+    dlib and the face_recognition models), so re-enrolling an image is a file
+    read instead of a dlib pass.
+
+    Every entry is one raw float64 file (1 KB for a 128-d encoding, empty when
+    the image had no face) under a two-character shard folder. Hits refresh
+    the file mtime; once the folder grows past `max_bytes` the least recently
+    used entries are deleted until it is under 90% of it.
+    """
+
+    def __init__(
+        self,
+        folder=ENCODING_CACHE_FOLDER,
+        max_bytes=64 * 1024 * 1024,
+        encoder_version=None,
+    ):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.encoder_version = (
+            encoder_version
+            if encoder_version is not None
+            else installed_encoder_version()
+        )
+        self.lock = threading.Lock()
+        self.total_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def key(self, image_path):
+        digest = hashlib.sha256(self.encoder_version.encode())
+        with open(image_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.folder, key[:2], f"{key}.f64")
+
+    def get(self, key):
+        """(True, encoding or None) on a hit, (False, None) on a miss."""
+        path = self.entry_path(key)
+        try:
+            encoding = np.fromfile(path, dtype=np.float64)
+            os.utime(path)
+        except FileNotFoundError:
+            self.count(hit=False)
+            return False, None
+        self.count(hit=True)
+        return True, encoding if encoding.size else None
+
+    def put(self, key, encoding):
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = (
+            np.asarray(encoding, dtype=np.float64)
+            if encoding is not None
+            else np.empty(0, dtype=np.float64)
+        )
+        # Unique per writer, threads and processes may put the same key at once.
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), suffix=".tmp", delete=False
+        ) as f:
+            data.tofile(f)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.remove(f.name)
+            raise
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = self.folder_bytes()
+            else:
+                self.total_bytes += data.nbytes
+            over = self.total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def get_or_compute(self, image_path, encode_fn):
+        """Cached encoding of `image_path`, computed with encode_fn(image_path) on a miss."""
+        key = self.key(image_path)
+        found, encoding = self.get(key)
+        if not found:
+            encoding = encode_fn(image_path)
+            self.put(key, encoding)
+        return encoding
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        METRICS.inc("encoding_cache_lookups_total", result="hit" if hit else "miss")
+
+    def entries(self):
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if name.endswith(".f64"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def folder_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Rescans the folder, other processes may be writing to it as well.
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        target = 0.9 * self.max_bytes
+        evicted = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        with self.lock:
+            self.total_bytes = total
+            self.evicted += evicted
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio(), 3),
+            "evicted": self.evicted,
+        }
+
+
+_default_cache = None
+
+
+def default_encoding_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EncodingCache()
+    return _default_cache
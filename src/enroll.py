@@ -0,0 +1,196 @@
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+
+from capture import IMAGE_EXTENSIONS
+from db import DBInterface
+from encoding_cache import default_encoding_cache
+from entities.known_face import KnownFace
+from entities.known_face_encoding import KnownFaceEncoding
+from utils import FaceRecognition
+
+
+def find_people_images(root):
+    """{person folder name: sorted image paths} for every subfolder of `root`."""
+    people = {}
+    for name in sorted(os.listdir(root)):
+        folder = os.path.join(root, name)
+        if not os.path.isdir(folder):
+            continue
+        images = sorted(
+            os.path.join(dirpath, f)
+            for dirpath, _, files in os.walk(folder)
+            for f in files
+            if f.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if images:
+            people[name] = images
+    return people
+
+
+class BulkEnroller:
+    """
+    Enrolls a tree of face images, one subfolder per person, as KnownFace
+    rows of `camera_id`.
+
+    Images are encoded on a FaceRecognition process pool (cached encodings
+    are looked up first) and the KnownFaceEncoding rows are appended in
+    batches of `batch_size`. People that already exist are reused and images
+    that already have a row are skipped, so an interrupted run is resumed by
+    running it again. At most `max_in_flight` images (4 per worker by
+    default) are queued on the pool, so an interrupt only drops those.
+    """
+
+    def __init__(
+        self,
+        camera_id,
+        num_workers=None,
+        batch_size=256,
+        report_every_sec=5,
+        use_cache=True,
+        max_in_flight=None,
+    ):
+        self.camera_id = camera_id
+        self.batch_size = batch_size
+        self.report_every_sec = report_every_sec
+        self.db = DBInterface()
+        self.encoding_cache = default_encoding_cache() if use_cache else None
+        num_workers = num_workers if num_workers is not None else os.cpu_count()
+        self.max_in_flight = max_in_flight or 4 * max(1, num_workers)
+        print(f"✅ Starting face worker pool with {num_workers} processes...")
+        self.face_recognition_util = FaceRecognition(num_workers=num_workers)
+        self.pending_rows = []
+        self.encoded = 0
+        self.no_face = 0
+        self.failed = 0
+
+    def known_face_ids(self, names):
+        existing = {
+            known_face.display_name: known_face.id
+            for known_face in KnownFace.get_rows_on_camera_id(self.camera_id)
+        }
+        for name in names:
+            if name not in existing:
+                existing[name] = self.db.createKnownFace(self.camera_id, name).id
+        return existing
+
+    def plan(self, root):
+        people = find_people_images(root)
+        known_face_ids = self.known_face_ids(people)
+        enrolled = KnownFaceEncoding.get_known_face_id_img_paths()
+        jobs = [
+            (known_face_ids[name], img_path)
+            for name, images in people.items()
+            for img_path in images
+            if (str(known_face_ids[name]), img_path) not in enrolled
+        ]
+        total = sum(len(images) for images in people.values())
+        print(
+            f"✅ {len(people)} people, {total} images, "
+            f"{total - len(jobs)} already enrolled, {len(jobs)} to encode"
+        )
+        return jobs
+
+    def encode_jobs(self, jobs):
+        # Yields (known_face_id, img_path, encoding) as encodings become available.
+        futures = {}
+        for known_face_id, img_path in jobs:
+            key = None
+            if self.encoding_cache is not None:
+                key = self.encoding_cache.key(img_path)
+                found, encoding = self.encoding_cache.get(key)
+                if found:
+                    yield known_face_id, img_path, encoding
+                    continue
+            future = self.face_recognition_util.submit_image_encoding(img_path)
+            if future.done():
+                # Encoded inline (no worker pool).
+                yield from self.finish(future, known_face_id, img_path, key)
+                continue
+            futures[future] = (known_face_id, img_path, key)
+            while len(futures) >= self.max_in_flight:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from self.finish(future, *futures.pop(future))
+
+        for future in as_completed(list(futures)):
+            yield from self.finish(future, *futures.pop(future))
+
+    def finish(self, future, known_face_id, img_path, key):
+        try:
+            encoding = future.result()
+        except Exception as e:
+            print(f"❌ Error during face encoding for {img_path}: {e}")
+            self.failed += 1
+            return
+        if key is not None:
+            self.encoding_cache.put(key, encoding)
+        yield known_face_id, img_path, encoding
+
+    def flush(self):
+        if self.pending_rows:
+            self.db.createKnownFaceEncodingsBulk(self.pending_rows)
+            self.pending_rows = []
+
+    def run(self, root):
+        jobs = self.plan(root)
+        start = last_report = time.time()
+        done = 0
+        completed = False
+        try:
+            for known_face_id, img_path, encoding in self.encode_jobs(jobs):
+                done += 1
+                if encoding is None:
+                    self.no_face += 1
+                else:
+                    self.encoded += 1
+                    self.pending_rows.append((known_face_id, img_path, encoding))
+                    if len(self.pending_rows) >= self.batch_size:
+                        self.flush()
+                if time.time() - last_report > self.report_every_sec:
+                    self.report(done, len(jobs), start)
+                    last_report = time.time()
+            completed = True
+        finally:
+            # Whatever was encoded before an interruption is kept for the resume,
+            # queued images are cancelled instead of waited for.
+            self.flush()
+            self.face_recognition_util.shutdown(
+                wait=completed, cancel_futures=not completed
+            )
+        self.report(done, len(jobs), start)
+        if self.encoding_cache is not None:
+            print(f"📊 Encoding cache: {self.encoding_cache.stats()}")
+
+    def report(self, done, total, start):
+        elapsed = time.time() - start
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 else 0.0
+        print(
+            f"🕒 {done}/{total} images, {rate:.1f} img/s, ETA {eta:.0f} sec "
+            f"(encoded {self.encoded}, no face {self.no_face}, failed {self.failed})"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Enroll a folder of face images, one subfolder per person."
+    )
+    parser.add_argument("root", help="folder with one image subfolder per person")
+    parser.add_argument("--camera-id", type=int, required=True)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    BulkEnroller(
+        camera_id=args.camera_id,
+        num_workers=args.workers,
+        batch_size=args.batch_size,
+        use_cache=not args.no_cache,
+    ).run(args.root)
+
+
+if __name__ == "__main__":
+    main()
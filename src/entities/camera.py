@@ -1,4 +1,4 @@
-from utils import get_last_row_id, append_dict_to_csv, get_with_id
+from utils import get_last_row_id, append_dict_to_csv, get_with_id, get_rows_where
 
 CAMERA_CSV = "data/Camera.csv"
 
@@ -46,3 +46,10 @@ class Camera:
     @classmethod
     def get_with_id(cls, id: int):
         return get_with_id(id, CAMERA_CSV, cls)
+
+    @staticmethod
+    def get_rows_on_building_id(building_id: int):
+        column_2_val = {
+            "building_id": building_id,
+        }
+        return get_rows_where(CAMERA_CSV, column_2_val, Camera)
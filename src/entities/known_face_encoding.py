@@ -1,6 +1,7 @@
 from utils import (
     get_last_row_id,
     append_dict_to_csv,
+    append_dicts_to_csv,
     get_with_id,
     get_rows_where,
     generate_id,
@@ -8,6 +9,7 @@ from utils import (
 )
 import numpy as np
 import json
+import csv
 
 KNOWN_FACE_ENCODING_CSV = "data/KnownFaceEncoding.csv"
 
@@ -37,20 +39,28 @@ class KnownFaceEncoding:
         if save:
             self.save()
 
-    def save(self):
+    def to_row(self):
         encoding_str = (
             self.serialization["encoding"](self.encoding)
             if "encoding" in self.serialization
             else str(self.encoding)
         )
 
-        data = {
+        return {
             "id": self.id,
             "known_face_id": self.known_face_id,
             "encoding": encoding_str,
             "img_path": self.img_path,
         }
-        append_dict_to_csv(KNOWN_FACE_ENCODING_CSV, data)
+
+    def save(self):
+        append_dict_to_csv(KNOWN_FACE_ENCODING_CSV, self.to_row())
+
+    @staticmethod
+    def save_many(known_face_encodings):
+        append_dicts_to_csv(
+            KNOWN_FACE_ENCODING_CSV, [row.to_row() for row in known_face_encodings]
+        )
 
     def __str__(self):
         enc = "encoding" if self.encoding is not None else "None"
@@ -65,6 +75,17 @@ class KnownFaceEncoding:
         encodings = [row.encoding for row in rows]
         return encodings
 
+    @staticmethod
+    def get_known_face_id_img_paths():
+        # Only the two small columns, the encodings are not deserialized.
+        try:
+            with open(KNOWN_FACE_ENCODING_CSV, "r") as f:
+                return {
+                    (row["known_face_id"], row["img_path"]) for row in csv.DictReader(f)
+                }
+        except FileNotFoundError:
+            return set()
+
     @staticmethod
     def get_with_id(cls, id: int):
         return get_with_id(id, KNOWN_FACE_ENCODING_CSV, cls)
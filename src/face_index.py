@@ -0,0 +1,478 @@
+import numpy as np
+
+INDEX_BACKENDS = ("exact", "ivf")
+
+
+def smallest_k(distances, positions, k):
+    # Row-wise k smallest distances in ascending order, padded with inf / -1.
+    if distances.shape[1] < k:
+        pad = k - distances.shape[1]
+        distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+        positions = np.pad(positions, ((0, 0), (0, pad)), constant_values=-1)
+    elif distances.shape[1] > k:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        distances = np.take_along_axis(distances, part, axis=1)
+        positions = np.take_along_axis(positions, part, axis=1)
+    order = np.argsort(distances, axis=1)
+    return (
+        np.take_along_axis(distances, order, axis=1),
+        np.take_along_axis(positions, order, axis=1),
+    )
+
+
+def as_queries(encodings, dim):
+    queries = np.asarray(encodings, dtype=np.float32).reshape(-1, dim)
+    return queries, np.einsum("ij,ij->i", queries, queries)
+
+
+class EncodingArena:
+    """
+    Growable float32 matrix of encodings with their squared norms and identity
+    ids. Distances are computed as ‖a‖² + ‖b‖² − 2a·b, one BLAS matmul per
+    block of `block_size` rows, so a search never allocates more than
+    queries × block_size distances.
+    """
+
+    def __init__(self, dim=128, capacity=64, block_size=65536):
+        self.dim = dim
+        self.block_size = block_size
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.sq_norms = np.empty(capacity, dtype=np.float32)
+        self.ids = np.empty(capacity, dtype=object)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, size):
+        capacity = len(self.vectors)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity)
+        for attr in ("vectors", "sq_norms", "ids"):
+            old = getattr(self, attr)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self.size] = old[: self.size]
+            setattr(self, attr, new)
+
+    def add(self, vectors, ids):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        end = self.size + len(vectors)
+        self.reserve(end)
+        self.vectors[self.size : end] = vectors
+        self.sq_norms[self.size : end] = np.einsum("ij,ij->i", vectors, vectors)
+        self.ids[self.size : end] = ids
+        self.size = end
+
+    def remove(self, identity_id):
+        keep = np.flatnonzero(self.ids[: self.size] != identity_id)
+        removed = self.size - len(keep)
+        if removed:
+            self.vectors[: len(keep)] = self.vectors[keep]
+            self.sq_norms[: len(keep)] = self.sq_norms[keep]
+            self.ids[: len(keep)] = self.ids[keep]
+            self.ids[len(keep) : self.size] = None
+            self.size = len(keep)
+        return removed
+
+    def sq_distances(self, queries, q_sq_norms, start=0, end=None):
+        end = self.size if end is None else end
+        distances = q_sq_norms[:, None] + self.sq_norms[start:end]
+        distances -= 2 * queries @ self.vectors[start:end].T
+        return distances
+
+    def search(self, queries, q_sq_norms, k):
+        """Exact top-k squared distances and row positions (-1 when missing)."""
+        best_d = np.empty((len(queries), 0), dtype=np.float32)
+        best_pos = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, self.size, self.block_size):
+            end = min(self.size, start + self.block_size)
+            distances = self.sq_distances(queries, q_sq_norms, start, end)
+            positions = np.broadcast_to(np.arange(start, end), distances.shape)
+            best_d, best_pos = smallest_k(
+                np.concatenate([best_d, distances], axis=1),
+                np.concatenate([best_pos, positions], axis=1),
+                k,
+            )
+        return smallest_k(best_d, best_pos, k)
+
+    def lookup(self, positions):
+        return np.where(positions >= 0, self.ids[positions], None)
+
+
+def to_distances(sq_distances):
+    return np.sqrt(np.maximum(sq_distances, 0))
+
+
+class ExactIndex:
+    """Brute-force known-face index, exact top-k with BLAS-backed distances."""
+
+    def __init__(self, dim=128, block_size=65536):
+        self.dim = dim
+        self.arena = EncodingArena(dim, block_size=block_size)
+
+    def __len__(self):
+        return len(self.arena)
+
+    def add(self, encodings, identity_ids):
+        self.arena.add(encodings, identity_ids)
+
+    def remove(self, identity_id):
+        return self.arena.remove(identity_id)
+
+    def search(self, encodings, k=1):
+        """(n, k) Euclidean distances and identity ids, nearest first."""
+        return self.search_queries(*as_queries(encodings, self.dim), k=k)
+
+    def search_queries(self, queries, q_sq_norms, k=1):
+        sq_distances, positions = self.arena.search(queries, q_sq_norms, k)
+        return to_distances(sq_distances), self.arena.lookup(positions)
+
+
+def kmeans(vectors, num_clusters, iters=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)].copy()
+    sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+    for _ in range(iters):
+        c_sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+        assign = (c_sq_norms - 2 * vectors @ centroids.T).argmin(axis=1)
+        counts = np.bincount(assign, minlength=num_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters with the points worst served by their centroid.
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            errors = (
+                sq_norms
+                + c_sq_norms[assign]
+                - 2 * np.einsum("ij,ij->i", vectors, centroids[assign])
+            )
+            centroids[empty] = vectors[np.argsort(errors)[-len(empty) :]]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Approximate known-face index: encodings are partitioned by k-means into
+    `nlist` inverted lists and a search only scans the `nprobe` lists whose
+    centroids are closest to the query.
+
+    Until `min_train` encodings were added the index is exact. It is trained
+    on a sample of at most `train_per_list` encodings per list, with
+    nlist ≈ √n unless given, and retrained when it has grown `retrain_growth`
+    times since the last training.
+    """
+
+    def __init__(
+        self,
+        dim=128,
+        nlist=None,
+        nprobe=16,
+        min_train=2048,
+        train_per_list=32,
+        retrain_growth=8,
+        kmeans_iters=10,
+        seed=0,
+    ):
+        self.dim = dim
+        self.fixed_nlist = nlist
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.train_per_list = train_per_list
+        self.retrain_growth = retrain_growth
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.centroids = None
+        self.lists = [EncodingArena(dim)]
+        self.trained_size = 0
+
+    def __len__(self):
+        return sum(len(arena) for arena in self.lists)
+
+    @property
+    def nlist(self):
+        return len(self.lists)
+
+    def add(self, encodings, identity_ids):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        identity_ids = np.asarray(identity_ids, dtype=object).reshape(-1)
+        if self.centroids is None:
+            self.lists[0].add(encodings, identity_ids)
+        else:
+            self.distribute(encodings, identity_ids)
+        size = len(self)
+        if (self.centroids is None and size >= self.min_train) or (
+            self.centroids is not None
+            and size >= self.retrain_growth * self.trained_size
+        ):
+            self.train()
+
+    def remove(self, identity_id):
+        return sum(arena.remove(identity_id) for arena in self.lists)
+
+    def train(self):
+        vectors = np.concatenate([a.vectors[: a.size] for a in self.lists])
+        ids = np.concatenate([a.ids[: a.size] for a in self.lists])
+        self.lists = []
+        nlist = self.fixed_nlist or max(1, int(np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(vectors), nlist * self.train_per_list)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        self.centroids = kmeans(sample, nlist, self.kmeans_iters, self.seed)
+        self.lists = [EncodingArena(self.dim) for _ in range(nlist)]
+        self.distribute(vectors, ids)
+        self.trained_size = len(vectors)
+
+    def assign(self, vectors, num_probes=1, block_size=16384):
+        # The `num_probes` nearest lists of every vector, in blocks of rows so
+        # bulk inserts don't allocate a full vectors × nlist score matrix.
+        c_sq_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        probes = np.empty((len(vectors), num_probes), dtype=np.int64)
+        for start in range(0, len(vectors), block_size):
+            scores = c_sq_norms - 2 * vectors[start : start + block_size] @ (
+                self.centroids.T
+            )
+            if num_probes == 1:
+                probes[start : start + block_size, 0] = scores.argmin(axis=1)
+            else:
+                probes[start : start + block_size] = np.argpartition(
+                    scores, num_probes - 1, axis=1
+                )[:, :num_probes]
+        return probes
+
+    def distribute(self, vectors, ids):
+        assign = self.assign(vectors)[:, 0]
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+        for list_idx in range(self.nlist):
+            rows = order[bounds[list_idx] : bounds[list_idx + 1]]
+            if len(rows):
+                self.lists[list_idx].add(vectors[rows], ids[rows])
+
+    def search(self, encodings, k=1, nprobe=None):
+        """(n, k) Euclidean distances and identity ids, nearest first."""
+        return self.search_queries(*as_queries(encodings, self.dim), k=k, nprobe=nprobe)
+
+    def search_queries(self, queries, q_sq_norms, k=1, nprobe=None):
+        if self.centroids is None:
+            sq_distances, positions = self.lists[0].search(queries, q_sq_norms, k)
+            return to_distances(sq_distances), self.lists[0].lookup(positions)
+
+        num_probes = min(nprobe or self.nprobe, self.nlist)
+        probes = self.assign(queries, num_probes)
+        cand_d = np.full((len(queries), num_probes * k), np.inf, dtype=np.float32)
+        cand_ids = np.full((len(queries), num_probes * k), None, dtype=object)
+        # Every probed list is scanned once for all the queries probing it.
+        for list_idx in np.unique(probes):
+            query_rows, probe_cols = np.nonzero(probes == list_idx)
+            arena = self.lists[list_idx]
+            sq_distances, positions = arena.search(
+                queries[query_rows], q_sq_norms[query_rows], k
+            )
+            cols = probe_cols[:, None] * k + np.arange(k)
+            cand_d[query_rows[:, None], cols] = sq_distances
+            cand_ids[query_rows[:, None], cols] = arena.lookup(positions)
+
+        order = np.argsort(cand_d, axis=1)[:, :k]
+        return (
+            to_distances(np.take_along_axis(cand_d, order, axis=1)),
+            np.take_along_axis(cand_ids, order, axis=1),
+        )
+
+
+class PersonEncodingArena:
+    """
+    Preallocated (max_people × per_person, dim) float32 matrix of the
+    encodings of a few tracked people (unknowns, alerted unknowns). Every
+    person owns a slot of `per_person` consecutive rows, taken from and given
+    back to a free list, so adding or removing a person is O(1) and the
+    matrix is reused for the whole run.
+
+    Unused rows are zero with an infinite squared norm: person_distances()
+    finds them infinitely far away and never matches them.
+
+    Once a person's rows are full, add_representative() keeps them diverse
+    instead of keeping the first encodings seen (see its docstring).
+    """
+
+    def __init__(self, max_people=10, per_person=5, dim=128):
+        self.max_people = max_people
+        self.per_person = per_person
+        self.dim = dim
+        rows = max_people * per_person
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.sq_norms = np.full(rows, np.inf, dtype=np.float32)
+        self.valid = np.zeros(rows, dtype=bool)
+        self.counts = np.zeros(max_people, dtype=np.int64)
+        # Distances between the encodings of every person, inf on the diagonal
+        # and for unused rows.
+        self.pair_distances = np.full(
+            (max_people, per_person, per_person), np.inf, dtype=np.float32
+        )
+        self.people = [None] * max_people
+        self.free_slots = list(range(max_people - 1, -1, -1))
+
+    def __len__(self):
+        """Number of stored encodings."""
+        return int(self.counts.sum())
+
+    def full(self):
+        return not self.free_slots
+
+    def slot_of(self, row):
+        return row // self.per_person
+
+    def add_person(self, person, encodings=()):
+        """Slot given to `person`, None when the arena is full."""
+        if not self.free_slots:
+            return None
+        slot = self.free_slots.pop()
+        self.people[slot] = person
+        for encoding in encodings:
+            self.add_encoding(slot, encoding)
+        return slot
+
+    def add_encoding(self, slot, encoding):
+        """Stores `encoding` in the next row of `slot`, False when it is full."""
+        count = self.counts[slot]
+        if count >= self.per_person:
+            return False
+        self.store(slot, count, encoding, self.distances_to(slot, encoding))
+        self.counts[slot] = count + 1
+        return True
+
+    def distances_to(self, slot, encoding):
+        # (per_person,) distances from `encoding` to the rows of `slot`.
+        rows = slice(slot * self.per_person, (slot + 1) * self.per_person)
+        encoding = np.asarray(encoding, dtype=np.float32)
+        return to_distances(
+            self.sq_norms[rows]
+            + encoding @ encoding
+            - 2 * self.vectors[rows] @ encoding
+        )
+
+    def store(self, slot, index, encoding, distances):
+        row = slot * self.per_person + index
+        self.vectors[row] = encoding
+        self.sq_norms[row] = self.vectors[row] @ self.vectors[row]
+        self.valid[row] = True
+        pair_distances = self.pair_distances[slot]
+        pair_distances[index, :] = distances
+        pair_distances[:, index] = distances
+        pair_distances[index, index] = np.inf
+
+    def add_representative(self, slot, encoding):
+        """
+        Adds `encoding` to the person in `slot` and returns its index among the
+        person's encodings, None when it was not kept.
+
+        While the slot has free rows the encoding is appended. Afterwards the
+        rows are kept as spread out as possible (greedy k-center): the encoding
+        replaces one of the two closest stored encodings if it is farther than
+        they are from each other from all the remaining ones, so the smallest
+        distance within the set never decreases. Computes per_person new
+        distances and takes an argmin over the per_person² cached pair
+        distances, O(per_person²) but only 25 values for the default 5.
+        """
+        count = self.counts[slot]
+        if count < self.per_person:
+            self.add_encoding(slot, encoding)
+            return int(count)
+        if self.per_person < 2:
+            # A single encoding has nothing to be spread out from.
+            return None
+        distances = self.distances_to(slot, encoding)
+        pair_distances = self.pair_distances[slot]
+        closest = np.unravel_index(pair_distances.argmin(), pair_distances.shape)
+        min_distance = pair_distances[closest]
+        best, best_distance = None, min_distance
+        for index in closest:
+            distance = np.delete(distances, index).min()
+            if distance > best_distance:
+                best, best_distance = int(index), distance
+        if best is not None:
+            self.store(slot, best, encoding, distances)
+        return best
+
+    def person_distances(self, encodings):
+        """(n, max_people) distance of every encoding to the nearest encoding of every person."""
+        queries, q_sq_norms = as_queries(encodings, self.dim)
+        sq_distances = q_sq_norms[:, None] + self.sq_norms
+        sq_distances -= 2 * queries @ self.vectors.T
+        sq_distances = sq_distances.reshape(len(queries), self.max_people, -1)
+        return to_distances(sq_distances.min(axis=2))
+
+    def slots_near(self, encodings, threshold, block_size=4096):
+        """
+        Slots of the people with an encoding closer than `threshold` to any of
+        `encodings`, one matmul per block of `block_size` encodings.
+        """
+        queries, q_sq_norms = as_queries(encodings, self.dim)
+        rows = np.flatnonzero(self.valid)
+        if not len(rows) or not len(queries):
+            return np.empty(0, dtype=np.int64)
+        vectors, sq_norms = self.vectors[rows], self.sq_norms[rows]
+        near = np.zeros(len(rows), dtype=bool)
+        sq_threshold = np.float32(threshold) ** 2
+        for start in range(0, len(queries), block_size):
+            end = start + block_size
+            sq_distances = sq_norms[:, None] + q_sq_norms[start:end]
+            sq_distances -= 2 * vectors @ queries[start:end].T
+            near |= sq_distances.min(axis=1) < sq_threshold
+        return np.unique(rows[near] // self.per_person)
+
+    def remove_person(self, slot):
+        rows = slice(slot * self.per_person, (slot + 1) * self.per_person)
+        self.vectors[rows] = 0
+        self.sq_norms[rows] = np.inf
+        self.valid[rows] = False
+        self.counts[slot] = 0
+        self.pair_distances[slot] = np.inf
+        self.people[slot] = None
+        self.free_slots.append(slot)
+
+
+def assign_greedy(distances, threshold):
+    """
+    One-to-one assignment of the rows of an (n, m) distance matrix to its
+    columns: pairs are taken closest first, skipping rows and columns that are
+    already assigned, and only when closer than `threshold`. Returns the column
+    of every row, -1 when unassigned.
+    """
+    assignment = np.full(len(distances), -1)
+    rows, cols = np.nonzero(distances < threshold)
+    taken = set()
+    for i in np.argsort(distances[rows, cols], kind="stable"):
+        row, col = rows[i], cols[i]
+        if assignment[row] < 0 and col not in taken:
+            assignment[row] = col
+            taken.add(col)
+    return assignment
+
+
+def match_frame(encodings, known_index=None, dim=128):
+    """
+    Nearest known face of every encoding of a frame, one batched search of
+    the known index for the whole frame.
+
+    Returns (known_distances, known_ids) of shape (n,), inf / None without a
+    neighbour. The faces left unknown are matched to the tracked unknowns
+    separately, see PersonEncodingArena.person_distances().
+    """
+    queries, q_sq_norms = as_queries(encodings, dim)
+    num_queries = len(queries)
+    if known_index is None or not num_queries:
+        return np.full(num_queries, np.inf), np.full(num_queries, None)
+    known_distances, known_ids = known_index.search_queries(queries, q_sq_norms)
+    return known_distances[:, 0], known_ids[:, 0]
+
+
+def make_known_index(backend="exact", **settings):
+    if backend == "exact":
+        return ExactIndex(**settings)
+    if backend == "ivf":
+        return IVFIndex(**settings)
+    raise ValueError(f"Unknown known-face index backend: {backend}")
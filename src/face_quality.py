@@ -0,0 +1,114 @@
+import threading
+import cv2
+import numpy as np
+
+from metrics import METRICS
+
+# Faces are compared at this size so sharpness doesn't depend on face size.
+SHARPNESS_SIZE = 64
+DEFAULT_MAX_YAW = 0.5
+
+
+def face_yaw(landmarks):
+    """
+    Yaw proxy from dlib's 5-point landmarks: 0 when the nose projects onto the
+    middle of the eye line, 1 when it projects onto an eye, >1 in profile.
+    """
+    points = np.array([(p.x, p.y) for p in landmarks.parts()], dtype=np.float64)
+    right_eye, left_eye, nose = points[0:2].mean(0), points[2:4].mean(0), points[4]
+    eye_line = left_eye - right_eye
+    denom = eye_line @ eye_line
+    if denom == 0:
+        return np.inf
+    t = (nose - right_eye) @ eye_line / denom
+    return abs(t - 0.5) * 2
+
+
+class FaceQualityGate:
+    """
+    Cheap checks between face detection and encoding. Faces that are too
+    small, blurred (Laplacian variance), too dark or too bright are not
+    encoded. Pose needs landmarks, so it is checked by the encoder: faces
+    turned more than `max_yaw` (see face_yaw), passed to get_encodings(),
+    come back as NaN encodings and are dropped by drop_pose_rejects().
+
+    Gated faces are counted per reason. With face tracking their tracks are
+    deferred: they stay pending and are retried on the next detection.
+    """
+
+    def __init__(
+        self,
+        min_size=40,
+        min_sharpness=25.0,
+        min_brightness=40,
+        max_brightness=220,
+        max_yaw=DEFAULT_MAX_YAW,
+        labels=None,
+    ):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_yaw = max_yaw
+        self.labels = labels or {}
+        self.lock = threading.Lock()
+        self.passed = 0
+        self.gated = {"size": 0, "blur": 0, "dark": 0, "bright": 0, "pose": 0}
+
+    def score(self, gray, box):
+        top, right, bottom, left = box
+        crop = gray[max(0, top) : max(0, bottom), max(0, left) : max(0, right)]
+        size = min(right - left, bottom - top)
+        if crop.size == 0:
+            return {"size": size, "sharpness": 0.0, "brightness": 0.0}
+        crop = cv2.resize(crop, (SHARPNESS_SIZE, SHARPNESS_SIZE))
+        return {
+            "size": size,
+            "sharpness": cv2.Laplacian(crop, cv2.CV_64F).var(),
+            "brightness": crop.mean(),
+        }
+
+    def reject_reason(self, scores):
+        if scores["size"] < self.min_size:
+            return "size"
+        if scores["brightness"] < self.min_brightness:
+            return "dark"
+        if scores["brightness"] > self.max_brightness:
+            return "bright"
+        if scores["sharpness"] < self.min_sharpness:
+            return "blur"
+        return None
+
+    def filter(self, frame, face_locations):
+        """Indices of the face_locations worth encoding."""
+        if len(face_locations) == 0:
+            return []
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        keep = []
+        for idx, box in enumerate(face_locations):
+            reason = self.reject_reason(self.score(gray, box))
+            if reason is None:
+                keep.append(idx)
+            else:
+                self.count(reason)
+        return keep
+
+    def drop_pose_rejects(self, encodings):
+        """Indices of the encodings that were not rejected for their pose."""
+        encodings = np.asarray(encodings)
+        if len(encodings) == 0:
+            return []
+        rejected = np.isnan(encodings).any(axis=1)
+        for _ in range(int(rejected.sum())):
+            self.count("pose")
+        with self.lock:
+            self.passed += int((~rejected).sum())
+        return np.flatnonzero(~rejected).tolist()
+
+    def count(self, reason):
+        with self.lock:
+            self.gated[reason] += 1
+        METRICS.inc("faces_gated_total", reason=reason, **self.labels)
+
+    def stats(self):
+        return {"passed": self.passed, "gated": dict(self.gated)}
@@ -0,0 +1,246 @@
+import itertools
+import threading
+import cv2
+import numpy as np
+
+
+def box_iou(a, b):
+    top, right, bottom, left = a
+    top_b, right_b, bottom_b, left_b = b
+    inter_w = min(right, right_b) - max(left, left_b)
+    inter_h = min(bottom, bottom_b) - max(top, top_b)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    area_a = (right - left) * (bottom - top)
+    area_b = (right_b - left_b) * (bottom_b - top_b)
+    return inter / float(area_a + area_b - inter)
+
+
+class FaceTrack:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.name = None
+        # Bumped every time the track is handed out for encoding, so a late name
+        # is only applied to the encoding it was matched for.
+        self.encode_id = 0
+        self.confidence = 1.0
+        self.missed = 0
+
+    def shift(self, dx, dy, width, height):
+        top, right, bottom, left = self.box
+        dx = int(round(np.clip(dx, -left, width - right)))
+        dy = int(round(np.clip(dy, -top, height - bottom)))
+        self.box = (top + dy, right + dx, bottom + dy, left + dx)
+
+
+class FaceTrackManager:
+    """
+    Follows faces between detections so the detector runs only every
+    `detect_every` frames (or right after a track is lost) and a face is only
+    re-encoded when its track is new or its confidence has decayed.
+
+    Boxes are (top, right, bottom, left) in full-frame coordinates while the
+    optical flow runs on grayscale frames downscaled by `scale`. Confidence
+    is reset to 1 when a face is encoded, decays by `decay` every followed
+    frame and is scaled by the IoU of every detection match, so drifting or
+    occluded tracks get re-identified.
+
+    Frames dropped by the pipeline queues or skipped for lack of motion are
+    fine to follow across, the pyramidal flow copes with a few frames of
+    movement. Only when more than `max_flow_sec` passed since the previous
+    tracked frame is the next frame a detection. Tracks are shared between
+    the faces and the match stages, so every access goes through the lock.
+    """
+
+    def __init__(
+        self,
+        detect_every=5,
+        iou_threshold=0.3,
+        max_missed=2,
+        decay=0.95,
+        min_confidence=0.5,
+        scale=0.5,
+        max_flow_sec=0.5,
+    ):
+        self.detect_every = detect_every
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.decay = decay
+        self.min_confidence = min_confidence
+        self.scale = scale
+        self.max_flow_sec = max_flow_sec
+        self.lock = threading.Lock()
+        self.tracks = []
+        self.ids = itertools.count()
+        self.prev_gray = None
+        self.prev_time = None
+        self.frames_since_detect = detect_every
+        self.lost = False
+        self.detections = 0
+        self.encodes = 0
+        self.frames = 0
+
+    def should_detect(self, timestamp=None):
+        with self.lock:
+            return (
+                self.frames_since_detect >= self.detect_every
+                or self.lost
+                or self.elapsed(timestamp) > self.max_flow_sec
+            )
+
+    def elapsed(self, timestamp):
+        # Seconds since the previous tracked frame, timestamps are datetimes.
+        if timestamp is None or self.prev_time is None:
+            return 0.0
+        return (timestamp - self.prev_time).total_seconds()
+
+    def update(self, face_locations, gray, timestamp=None):
+        """Associates fresh detections with tracks, returns the tracks to encode."""
+        with self.lock:
+            self.frames += 1
+            self.detections += 1
+            self.frames_since_detect = 1
+            self.lost = False
+            self.prev_gray = gray
+            self.prev_time = timestamp
+
+            pairs = sorted(
+                (
+                    (box_iou(track.box, box), t_idx, d_idx)
+                    for t_idx, track in enumerate(self.tracks)
+                    for d_idx, box in enumerate(face_locations)
+                ),
+                reverse=True,
+            )
+            matched_tracks, matched_boxes = set(), set()
+            for iou, t_idx, d_idx in pairs:
+                if iou < self.iou_threshold:
+                    break
+                if t_idx in matched_tracks or d_idx in matched_boxes:
+                    continue
+                track = self.tracks[t_idx]
+                track.box = tuple(face_locations[d_idx])
+                track.confidence *= iou
+                track.missed = 0
+                matched_tracks.add(t_idx)
+                matched_boxes.add(d_idx)
+
+            for t_idx, track in enumerate(self.tracks):
+                if t_idx not in matched_tracks:
+                    track.missed += 1
+            self.tracks = [
+                track for track in self.tracks if track.missed <= self.max_missed
+            ]
+
+            for d_idx, box in enumerate(face_locations):
+                if d_idx not in matched_boxes:
+                    self.tracks.append(FaceTrack(next(self.ids), tuple(box)))
+
+            to_encode = [
+                track
+                for track in self.tracks
+                if track.missed == 0
+                and (track.name is None or track.confidence < self.min_confidence)
+            ]
+            for track in to_encode:
+                track.confidence = 1.0
+                track.encode_id += 1
+            self.encodes += len(to_encode)
+            return to_encode
+
+    def defer(self, tracks):
+        # Tracks that were not encoded after all (e.g. gated for quality) are
+        # encoded on the next detection instead.
+        with self.lock:
+            for track in tracks:
+                track.confidence = 0.0
+            self.encodes -= len(tracks)
+
+    def follow(self, gray, timestamp=None):
+        """Moves every track by the median optical flow of its corners."""
+        with self.lock:
+            self.frames += 1
+            self.frames_since_detect += 1
+            prev_gray, self.prev_gray = self.prev_gray, gray
+            elapsed = self.elapsed(timestamp)
+            self.prev_time = timestamp
+            if (
+                prev_gray is None
+                or prev_gray.shape != gray.shape
+                or elapsed > self.max_flow_sec
+            ):
+                self.lost = bool(self.tracks)
+                return
+
+            height, width = gray.shape
+            for track in self.tracks:
+                top, right, bottom, left = (int(v * self.scale) for v in track.box)
+                top, left = max(0, top), max(0, left)
+                corners = cv2.goodFeaturesToTrack(
+                    prev_gray[top:bottom, left:right],
+                    maxCorners=30,
+                    qualityLevel=0.01,
+                    minDistance=3,
+                )
+                if corners is None or len(corners) < 3:
+                    self.mark_missed(track)
+                    continue
+                corners = corners.astype(np.float32) + np.array(
+                    [left, top], dtype=np.float32
+                )
+                moved, status, _ = cv2.calcOpticalFlowPyrLK(
+                    prev_gray, gray, corners, None
+                )
+                good = status.flatten() == 1
+                if good.sum() < 3:
+                    self.mark_missed(track)
+                    continue
+                dx, dy = np.median((moved - corners)[good].reshape(-1, 2), axis=0)
+                track.shift(
+                    dx / self.scale,
+                    dy / self.scale,
+                    width / self.scale,
+                    height / self.scale,
+                )
+                track.confidence *= self.decay
+
+    def set_names(self, tracks, encode_ids, names):
+        """
+        Names matched for the encodings of `tracks`, skipped for tracks that
+        were re-encoded or dropped since.
+        """
+        with self.lock:
+            live = set(map(id, self.tracks))
+            for track, encode_id, name in zip(tracks, encode_ids, names):
+                if id(track) in live and track.encode_id == encode_id:
+                    track.name = name
+
+    def snapshot(self):
+        """The current tracks and their boxes, taken together under the lock."""
+        with self.lock:
+            return list(self.tracks), [track.box for track in self.tracks]
+
+    def names(self, tracks):
+        with self.lock:
+            return [track.name if track.name is not None else "..." for track in tracks]
+
+    def mark_missed(self, track):
+        track.missed += 1
+        track.confidence *= self.decay
+        self.lost = True
+
+    def stats(self):
+        with self.lock:
+            return {
+                "frames": self.frames,
+                "detections": self.detections,
+                "encodes": self.encodes,
+                "tracks": len(self.tracks),
+            }
+
+
+def tracking_gray(frame, scale=0.5):
+    small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+    return cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
@@ -0,0 +1,287 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+METRIC_PREFIX = "security"
+
+# Latency buckets in seconds, from 0.5 ms up to 10 s.
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation.
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[idx] if idx < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "count": self.count,
+                "sum": self.sum,
+                "p50": self.quantile(0.5),
+                "p95": self.quantile(0.95),
+                "p99": self.quantile(0.99),
+                "buckets": dict(zip([str(b) for b in self.buckets], self.counts)),
+            }
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+def label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Process-wide histograms, counters and gauges keyed by name and labels.
+
+    Everything is a no-op until enable() is called, so instrumented code only
+    pays for one attribute check when metrics are off.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics = {}
+        self.types = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+        self.exporter = None
+        self.export_path = None
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def get(self, kind, name, labels):
+        key = (name, label_key(labels))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = kind()
+                    self.metrics[key] = metric
+                    self.types[name] = kind
+        return metric
+
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            self.get(Histogram, name, labels).observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        if self.enabled:
+            self.get(Counter, name, labels).inc(amount)
+
+    def set_gauge(self, name, value, **labels):
+        if self.enabled:
+            self.get(Gauge, name, labels).set(value)
+
+    def timer(self, name, **labels):
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self.get(Histogram, name, labels))
+
+    def timed(self, name, **labels):
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.timer(name, **labels):
+                    return fn(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def add_collector(self, fn):
+        # Collectors refresh gauges (fps, queue depth, ...) right before export.
+        self.collectors.append(fn)
+
+    def remove_collector(self, fn):
+        if fn in self.collectors:
+            self.collectors.remove(fn)
+
+    def collect(self):
+        for collector in list(self.collectors):
+            try:
+                collector()
+            except Exception as e:
+                print(f"❌ Metrics collector failed: {e}")
+
+    def to_prometheus(self):
+        lines = []
+        by_name = {}
+        for (name, labels), metric in list(self.metrics.items()):
+            by_name.setdefault(name, []).append((labels, metric))
+
+        for name in sorted(by_name):
+            full_name = f"{METRIC_PREFIX}_{name}"
+            kind = self.types[name]
+            lines.append(f"# TYPE {full_name} {kind.__name__.lower()}")
+            for labels, metric in by_name[name]:
+                if kind is Histogram:
+                    snapshot = metric.snapshot()
+                    cumulative = 0
+                    for le, count in list(snapshot["buckets"].items()) + [
+                        ("+Inf", metric.counts[-1])
+                    ]:
+                        cumulative += count
+                        lines.append(
+                            f"{full_name}_bucket{format_labels(labels, le=le)} {cumulative}"
+                        )
+                    lines.append(
+                        f"{full_name}_sum{format_labels(labels)} {snapshot['sum']}"
+                    )
+                    lines.append(
+                        f"{full_name}_count{format_labels(labels)} {snapshot['count']}"
+                    )
+                else:
+                    lines.append(f"{full_name}{format_labels(labels)} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        data = {}
+        for (name, labels), metric in list(self.metrics.items()):
+            entry = {"labels": dict(labels)}
+            if isinstance(metric, Histogram):
+                entry.update(metric.snapshot())
+            else:
+                entry["value"] = metric.value
+            data.setdefault(name, []).append(entry)
+        return json.dumps({"timestamp": time.time(), "metrics": data}, indent=2)
+
+    def export(self, path, fmt="prometheus"):
+        self.collect()
+        content = self.to_json() if fmt == "json" else self.to_prometheus()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def start_exporter(self, path, fmt="prometheus", every_sec=15):
+        if self.exporter is not None:
+            if path != self.export_path:
+                print(f"⚠️ Metrics already exported to {self.export_path}")
+            return
+        self.enable()
+        self.export_path = path
+        self.exporter = threading.Thread(
+            target=self.export_loop, args=(path, fmt, every_sec), daemon=True
+        )
+        self.exporter.start()
+        print(f"✅ Exporting metrics to {path} every {every_sec} sec")
+
+    def export_loop(self, path, fmt, every_sec):
+        while self.enabled:
+            time.sleep(every_sec)
+            try:
+                self.export(path, fmt)
+            except Exception as e:
+                print(f"❌ Failed to export metrics: {e}")
+
+
+def format_labels(labels, **extra):
+    items = list(labels) + [(k, str(v)) for k, v in extra.items()]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def instrument_methods(prefix):
+    """Class decorator timing every public method as `<prefix>_call_seconds`."""
+
+    def decorator(cls):
+        for attr, fn in list(vars(cls).items()):
+            if callable(fn) and not attr.startswith("_"):
+                setattr(
+                    cls, attr, METRICS.timed(f"{prefix}_call_seconds", method=attr)(fn)
+                )
+        return cls
+
+    return decorator
+
+
+METRICS = MetricsRegistry()
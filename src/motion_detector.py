@@ -1,4 +1,5 @@
 import cv2
+from metrics import METRICS
 
 
 class MotionDetector:
@@ -7,12 +8,17 @@ class MotionDetector:
         self.motion_sensitivity = sensitivity
 
     def detect_motion(self, frame):
+        return len(self.detect_motion_regions(frame)) > 0
+
+    @METRICS.timed("motion_detection_seconds")
+    def detect_motion_regions(self, frame, min_area=100):
+        """Bounding boxes (top, right, bottom, left) of the changed regions, [] if none."""
         gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         gray = cv2.GaussianBlur(gray, (21, 21), 0)
 
         if self.motion_background is None:
             self.motion_background = gray
-            return False
+            return []
 
         frame_delta = cv2.absdiff(self.motion_background, gray)
         thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
@@ -20,5 +26,13 @@ class MotionDetector:
         motion_score = cv2.countNonZero(thresh)
         if motion_score > self.motion_sensitivity:
             self.motion_background = gray
-            return True
-        return False
+            contours, _ = cv2.findContours(
+                thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+            )
+            boxes = [cv2.boundingRect(contour) for contour in contours]
+            regions = [
+                (y, x + w, y + h, x) for x, y, w, h in boxes if w * h >= min_area
+            ]
+            # Many tiny blobs can still add up to motion, keep them all then.
+            return regions or [(y, x + w, y + h, x) for x, y, w, h in boxes]
+        return []
@@ -0,0 +1,267 @@
+import queue
+import threading
+import time
+import numpy as np
+from metrics import METRICS
+
+
+class LatestQueue:
+    """Bounded queue that drops the oldest item instead of blocking when full."""
+
+    def __init__(self, maxsize=1):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, item):
+        with self.lock:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+class FramePacket:
+    def __init__(self, frame, timestamp, frame_id):
+        self.frame_id = frame_id
+        self.frame = frame
+        self.orig_frame = frame
+        self.timestamp = timestamp
+        self.motion_detected = False
+        self.motion_regions = []
+        self.face_locations = []
+        self.encodings = []
+        self.names = []
+        # Set when faces are tracked between detections: all tracks in view and the
+        # ones whose `encodings` were computed for this frame.
+        self.tracks = None
+        self.pending_tracks = []
+        self.pending_encode_ids = []
+        self.matched_names = []
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.processed = 0
+        self.busy_time = 0.0
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, elapsed):
+        with self.lock:
+            self.processed += 1
+            self.busy_time += elapsed
+
+    def fps(self):
+        elapsed = time.time() - self.start_time
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def avg_latency_ms(self):
+        return 1000 * self.busy_time / self.processed if self.processed else 0.0
+
+
+class Stage:
+    def __init__(self, name, fn, input_queue=None, output_queue=None, labels=None):
+        self.name = name
+        self.labels = labels or {}
+        self.fn = fn
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.stats = StageStats(name)
+        self.running = False
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    def start(self):
+        self.running = True
+        self.stats.start_time = time.time()
+        self.thread.start()
+
+    def next_item(self):
+        # A stage without an input queue is a source: fn() produces the items.
+        if self.input_queue is None:
+            return None, True
+        try:
+            return self.input_queue.get(timeout=0.1), True
+        except queue.Empty:
+            return None, False
+
+    def run(self):
+        while self.running:
+            item, ready = self.next_item()
+            if not ready:
+                continue
+            start = time.perf_counter()
+            try:
+                result = self.fn() if self.input_queue is None else self.fn(item)
+            except Exception as e:
+                print(f"❌ Stage '{self.name}' failed: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            self.stats.add(elapsed)
+            METRICS.observe("stage_seconds", elapsed, stage=self.name, **self.labels)
+
+            if result is None:
+                if self.input_queue is None:
+                    print(f"⚠️ Source '{self.name}' exhausted, stopping.")
+                    self.running = False
+                continue
+            if self.output_queue is not None:
+                self.output_queue.put(result)
+
+    def stop(self):
+        self.running = False
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+
+
+class FramePipeline:
+    """
+    Chain of stages, each on its own thread, joined by single-slot LatestQueues.
+
+    A slow stage only ever sees the newest packet of the stage before it; older
+    packets are dropped and counted.
+    """
+
+    def __init__(self, queue_size=1, report_every_sec=10, labels=None):
+        self.queue_size = queue_size
+        self.labels = labels or {}
+        self.report_every_sec = report_every_sec
+        self.stages = []
+        self.output = LatestQueue(maxsize=queue_size)
+        self.last_report_time = time.time()
+
+    def add_source(self, name, read_fn):
+        if self.stages:
+            raise ValueError("Source must be the first stage of the pipeline.")
+        self.stages.append(
+            Stage(name, read_fn, output_queue=self.output, labels=self.labels)
+        )
+        return self
+
+    def add_stage(self, name, fn):
+        if not self.stages:
+            raise ValueError("Add a source before adding stages.")
+        input_queue = LatestQueue(maxsize=self.queue_size)
+        self.stages[-1].output_queue = input_queue
+        self.stages.append(Stage(name, fn, input_queue, self.output, self.labels))
+        return self
+
+    def start(self):
+        for stage in reversed(self.stages):
+            stage.start()
+        METRICS.add_collector(self.publish_metrics)
+        return self
+
+    def is_running(self):
+        return bool(self.stages) and self.stages[0].running
+
+    def get_output(self, timeout=0.1):
+        try:
+            return self.output.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+        METRICS.remove_collector(self.publish_metrics)
+        self.report()
+
+    def stats(self):
+        stats = {}
+        for stage in self.stages:
+            dropped = stage.input_queue.dropped if stage.input_queue else 0
+            stats[stage.name] = {
+                "processed": stage.stats.processed,
+                "fps": round(stage.stats.fps(), 2),
+                "avg_latency_ms": round(stage.stats.avg_latency_ms(), 2),
+                "dropped": dropped,
+                "queue_depth": stage.input_queue.qsize() if stage.input_queue else 0,
+            }
+        return stats
+
+    def publish_metrics(self):
+        for name, s in self.stats().items():
+            labels = dict(self.labels, stage=name)
+            METRICS.set_gauge("stage_fps", s["fps"], **labels)
+            METRICS.set_gauge("stage_queue_depth", s["queue_depth"], **labels)
+            METRICS.set_gauge("stage_dropped_frames", s["dropped"], **labels)
+
+    def report(self):
+        print("📊 Pipeline stage throughput:")
+        for name, s in self.stats().items():
+            print(
+                f"   {name:<10} {s['fps']:>7.2f} fps  {s['avg_latency_ms']:>8.2f} ms/frame  "
+                f"processed={s['processed']}  dropped={s['dropped']}"
+            )
+
+    def maybe_report(self):
+        if time.time() - self.last_report_time > self.report_every_sec:
+            self.report()
+            self.last_report_time = time.time()
+
+
+class LatencyReport:
+    """Per-stage latency samples of a headless run, summarized as percentiles."""
+
+    def __init__(self):
+        self.samples = {}
+        self.frames = 0
+        self.motion_skipped = 0
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    def add(self, stage, elapsed):
+        self.samples.setdefault(stage, []).append(elapsed)
+
+    def timed(self, stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.add(stage, time.perf_counter() - start)
+        return result
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+
+    def fps(self):
+        end = self.end_time if self.end_time is not None else time.perf_counter()
+        elapsed = end - self.start_time
+        return self.frames / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        summary = {}
+        for stage, samples in self.samples.items():
+            ms = np.array(samples) * 1000
+            summary[stage] = {
+                "count": len(samples),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+            }
+        return summary
+
+    def print(self):
+        skipped = self.motion_skipped / self.frames if self.frames else 0.0
+        print(f"📊 Replay: {self.frames} frames at {self.fps():.2f} fps")
+        print(f"   skipped by motion detector: {100 * skipped:.1f}%")
+        print(
+            f"   {'stage':<10} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        )
+        for stage, s in self.summary().items():
+            print(
+                f"   {stage:<10} {s['count']:>7} {s['p50_ms']:>9.2f} "
+                f"{s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}"
+            )
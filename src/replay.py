@@ -0,0 +1,71 @@
+import argparse
+
+from capture import open_source
+from security_system import SecuritySystem
+from face_index import INDEX_BACKENDS
+from detectors import DETECTOR_BACKENDS
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a video file or image folder through the recognition "
+        "hot path without a window and print a per-stage latency report."
+    )
+    parser.add_argument("source", help="video file or directory of frames")
+    parser.add_argument("--camera-id", type=int, default=0)
+    parser.add_argument(
+        "--pace", action="store_true", help="throttle replay to the source fps"
+    )
+    parser.add_argument("--fps", type=float, default=None, help="fps of image folders")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--captions", action="store_true")
+    parser.add_argument("--motion-sensitivity", type=int, default=5000)
+    parser.add_argument(
+        "--detect-every",
+        type=int,
+        default=1,
+        help="run the face detector every N frames and track faces in between",
+    )
+    parser.add_argument(
+        "--full-frame",
+        action="store_true",
+        help="search the whole frame for faces instead of only the motion regions",
+    )
+    parser.add_argument(
+        "--no-quality-gate",
+        action="store_true",
+        help="encode every detected face, however small, blurred or turned",
+    )
+    parser.add_argument("--detector", choices=DETECTOR_BACKENDS, default="hog")
+    parser.add_argument("--known-index", choices=INDEX_BACKENDS, default="exact")
+    args = parser.parse_args()
+
+    system = SecuritySystem(
+        camera_id=args.camera_id,
+        motion_sensitivity=args.motion_sensitivity,
+        enable_captions=args.captions,
+        detect_every_n_frames=args.detect_every,
+        detect_in_motion_regions=not args.full_frame,
+        known_index=args.known_index,
+        detector=args.detector,
+        enable_quality_gate=not args.no_quality_gate,
+        match_unknown_threshold=0.6,
+        match_known_threshold=0.5,
+    )
+    source = open_source(args.source, fps=args.fps)
+    try:
+        report = system.run_headless(
+            source,
+            pace=args.pace,
+            max_frames=args.max_frames,
+            captions=args.captions,
+        )
+    finally:
+        source.release()
+    report.print()
+    if args.captions and system.caption_cache is not None:
+        print(f"📊 Caption cache: {system.caption_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
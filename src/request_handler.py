@@ -48,10 +48,10 @@ class RequestHandler:
             except Exception as e:
                 print(f"❌ Failed to create pending alarm row for response: {e}")
 
-    def add_new_known_face(self, name, img_enc):
+    def add_new_known_face(self, known_face_id, name, img_enc):
         # get lock
         with self.updated_known_names_encodings_lock:
-            self.updated_known_names_encodings.append((name, img_enc))
+            self.updated_known_names_encodings.append((known_face_id, name, img_enc))
             print(f"✅ Added new known face: {name} in updated_known_names_encodings")
 
     def add_updated_alarm(self, alarm_id, status):
@@ -136,12 +136,15 @@ class RequestHandler:
                         known_face_encoding = self.db.createKnownFaceEncoding(
                             known_face.id, img_path, encoding
                         )
-                        self.add_new_known_face(name, encoding)
+                        self.add_new_known_face(known_face.id, name, encoding)
 
                 if len(lines) > 1:
                     # Clear the file after processing
                     with open(self.new_known_face_input_file, "w") as f:
                         f.write(lines[0])  # keep the header line
+                    encoding_cache = self.face_recognition_util.encoding_cache
+                    if encoding_cache is not None:
+                        print(f"📊 Encoding cache: {encoding_cache.stats()}")
 
             except Exception as e:
                 print(f"Error processing new known faces: {e}")
@@ -12,43 +12,19 @@ from request_handler import RequestHandler
 from motion_detector import MotionDetector
 from db import DBInterface
 from utils import FaceRecognition
-
-from lavis.models import load_model_and_preprocess
-import torch
-from PIL import Image
+from pipeline import FramePipeline, FramePacket, LatencyReport
+from capture import FrameGrabber, open_source
+from metrics import METRICS
+from face_tracker import FaceTrackManager, tracking_gray
+from face_index import make_known_index, match_frame
+from encoding_cache import default_encoding_cache
+from face_quality import FaceQualityGate
+from caption import LazyCaptionHandler, CaptionWorker, CaptionCache
 
 SNAPSHOT_ALERT_FOLDER = "data/snapshots/alerts"
 SNAPSHOT_UKNOWN_FOLDER = "data/snapshots/unknowns"
 
 
-class CaptionHandler:
-    def __init__(self):
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model, self.vis_processors, self.txt_processors = (
-            load_model_and_preprocess(
-                # name="blip2",
-                # model_type="coco",
-                name="blip_caption",
-                model_type="base_coco",
-                is_eval=True,
-                device="cpu",
-            )
-        )
-
-    def generate_caption(self, image):
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(image_rgb)
-        pil_image = self.vis_processors["eval"](pil_image).unsqueeze(0).to(self.device)
-        caption = self.model.generate(
-            {"image": pil_image},
-            use_nucleus_sampling=True,
-            # max_length=20,
-            num_captions=5,
-        )
-        print(caption)
-        return caption[0]
-
-
 class SecuritySystem:
     def __init__(
         self,
@@ -62,13 +38,43 @@ class SecuritySystem:
         motion_sensitivity=5000,
         enable_notification=False,
         max_encodings_per_person=5,
+        detect_every_n_frames=1,
+        detect_in_motion_regions=True,
+        known_index="exact",
+        known_index_settings=None,
+        detector=None,
+        detector_settings=None,
+        enable_quality_gate=True,
+        quality_settings=None,
         check_db_update_per_sec=60,
         update_db_active_alert_per_sec=10,
         update_captions_per_sec=20,
+        enable_captions=True,
+        caption_cache_size=32,
+        caption_cache_ttl_sec=300,
+        caption_cache_max_distance=2,
+        report_every_sec=30,
+        video_source=0,
+        capture_settings=None,
+        metrics_path=None,
+        metrics_format="prometheus",
+        metrics_every_sec=15,
+        face_recognition_util=None,
+        face_workers=0,
+        caption_handler=None,
+        caption_settings=None,
     ):
+        self.init_time = time.perf_counter()
+        self.time_to_first_frame = None
         # os.makedirs(SNAPSHOT_ALERT_FOLDER, exist_ok=True)
         # os.makedirs(SNAPSHOT_UKNOWN_FOLDER, exist_ok=True)
-        # self.camera_id = camera_id
+        self.camera_id = camera_id
+        self.video_source = video_source
+        self.capture_settings = capture_settings or {}
+        if metrics_path is not None:
+            METRICS.start_exporter(
+                metrics_path, fmt=metrics_format, every_sec=metrics_every_sec
+            )
         # self.known_faces_folder = known_faces_folder
         # self.match_known_threshold = match_known_threshold
         # self.enable_notification = enable_notification
@@ -77,17 +83,14 @@ class SecuritySystem:
 
         self.db = DBInterface()
         print("✅ Loading face encodings...")
-        self.encoding_2_name = self.db.get_known_faces_name_encodings(
-            camera_id=camera_id
-        )
-        self.known_encodings = (
-            np.array(list(self.encoding_2_name.keys()))
-            if self.encoding_2_name
-            else np.empty((0, 128), dtype=np.float64)
-        )
-
-        self.known_names = list(self.encoding_2_name.values())
-        print(f"✅ Loaded {len(self.known_names)} known faces")
+        # The index is keyed by KnownFace id, names are looked up at match time
+        # so people sharing a display name stay separate identities.
+        self.known_names = {}
+        self.known_index = make_known_index(known_index, **(known_index_settings or {}))
+        known_faces = self.db.get_known_faces_id_name_encodings(camera_id=camera_id)
+        if known_faces:
+            self.add_new_known_faces(*zip(*known_faces))
+        print(f"✅ Loaded {len(self.known_index)} known faces")
 
         # active_alert = self.db.get_latest_alarm_info(
         #     self.camera_id, max_encodings_per_person
@@ -113,12 +116,41 @@ class SecuritySystem:
         #     max_encodings_per_person=max_encodings_per_person,
         #     active_alert=active_alert,
         # )
+        self.match_known_threshold = match_known_threshold
+        self.tracker_settings = dict(
+            alert_after_sec=alert_after_sec,
+            forget_after_sec=forget_after_sec,
+            match_unknown_threshold=match_unknown_threshold,
+            match_known_threshold=match_known_threshold,
+            max_unknowns=max_unknowns,
+            max_encodings_per_person=max_encodings_per_person,
+        )
 
         self.motion_detector = MotionDetector(sensitivity=motion_sensitivity)
+        self.detect_in_motion_regions = detect_in_motion_regions
+        # None uses the FaceRecognition default (dlib HOG).
+        self.detector = (detector, detector_settings or {}) if detector else None
+        self.quality_gate = (
+            FaceQualityGate(labels={"camera": camera_id}, **(quality_settings or {}))
+            if enable_quality_gate
+            else None
+        )
+        self.face_tracker = (
+            FaceTrackManager(detect_every=detect_every_n_frames)
+            if detect_every_n_frames > 1
+            else None
+        )
 
         # pending_alarm_ids = self.db.get_pending_alarm_ids(camera_id)
 
-        self.face_recognition_util = FaceRecognition()
+        self.face_recognition_util = (
+            face_recognition_util
+            if face_recognition_util is not None
+            else FaceRecognition(
+                num_workers=face_workers,
+                encoding_cache=default_encoding_cache(),
+            )
+        )
         # self.request_handler = RequestHandler(
         #     camera_id=self.camera_id,
         #     db=self.db,
@@ -127,24 +159,37 @@ class SecuritySystem:
         # )
         # self.last_check_make_updates_time = time.time()
 
-        print("✅ Initializing CaptionHandler...")
-
-        start = time.time()
-        self.caption_handler = CaptionHandler()
-        print("🕒 Caption took:", round(time.time() - start, 2), "sec")
+        # The caption model loads in the background; frames are processed without
+        # captions until it is ready, or always when captions are disabled.
+        if caption_handler is not None:
+            self.caption_handler = caption_handler
+        elif enable_captions:
+            print("✅ Loading CaptionHandler in the background...")
+            self.caption_handler = LazyCaptionHandler(**(caption_settings or {}))
+        else:
+            self.caption_handler = None
 
         # self.request_handler.listen_loop()
 
         # self.notifier = NotificationEngine()
         self.final_caption_time = None
         self.update_captions_per_sec = update_captions_per_sec
+        self.report_every_sec = report_every_sec
+        self.caption_worker = None
+        self.caption_cache = (
+            CaptionCache(
+                max_size=caption_cache_size,
+                ttl_sec=caption_cache_ttl_sec,
+                max_distance=caption_cache_max_distance,
+            )
+            if caption_cache_size > 0
+            else None
+        )
         print("✅ Starting Security System...")
 
-    def add_new_known_faces(self, names, new_encodings):
-        self.known_names += names
-        self.known_encodings = np.concatenate(
-            [self.known_encodings, np.array(new_encodings)]
-        )
+    def add_new_known_faces(self, known_face_ids, names, new_encodings):
+        self.known_names.update(zip(known_face_ids, names))
+        self.known_index.add(np.array(new_encodings), list(known_face_ids))
 
     def check_make_updates(self):
         updated_alarms = self.request_handler.get_updated_alarm_ids_status()
@@ -161,10 +206,11 @@ class SecuritySystem:
 
         updated_known_names_encodings = self.request_handler.get_new_known_faces()
         if updated_known_names_encodings:
-            new_names = [item[0] for item in updated_known_names_encodings]
-            new_encodings = [item[1] for item in updated_known_names_encodings]
+            new_ids = [item[0] for item in updated_known_names_encodings]
+            new_names = [item[1] for item in updated_known_names_encodings]
+            new_encodings = [item[2] for item in updated_known_names_encodings]
             print(f"✅ Received {len(new_names)} new known faces: {new_names}")
-            self.add_new_known_faces(new_names, new_encodings)
+            self.add_new_known_faces(new_ids, new_names, new_encodings)
             active_alert_id = (
                 self.tracker.active_alert.id if self.tracker.active_alert else None
             )
@@ -211,25 +257,33 @@ class SecuritySystem:
                 frame, frame, (left + 6, bottom - 6), font, 1.0, (255, 255, 255), 1
             )
 
-    def get_matches(self, face_encoding):
-        best_match_index, best_distance = (
-            self.face_recognition_util.get_best_distance_idx(
-                self.known_encodings, face_encoding
+    @METRICS.timed("match_seconds")
+    def match_faces(self, face_encodings):
+        """
+        Names of all encodings of a frame, matched against the known faces in
+        one match_frame() call. The unknown ones are matched to the tracked
+        unknowns afterwards, in track_unknowns().
+        """
+        known_distances, known_ids = match_frame(face_encodings, self.known_index)
+        names = [
+            (
+                self.known_names[known_face_id]
+                if known_face_id is not None and distance < self.match_known_threshold
+                else "Unknown"
             )
-        )
-
-        if best_match_index is not None and best_distance < self.match_known_threshold:
-            return self.known_names[best_match_index]
-        else:
-            return "Unknown"
+            for distance, known_face_id in zip(known_distances, known_ids)
+        ]
+        return names
 
     def system_alert(self, alert, frame):
         if not self.alarm_saved:
+            alert.caption = self.caption_worker.latest() if self.caption_worker else ""
             print(str(alert))
             self.request_handler.add_pending_alert(alert.id)
             snapshot = frame.copy()
             filename = os.path.join(SNAPSHOT_ALERT_FOLDER, f"alert_{alert.id}.jpg")
-            cv2.imwrite(filename, snapshot)
+            with METRICS.timer("snapshot_write_seconds"):
+                cv2.imwrite(filename, snapshot)
             self.db.createAlarm(
                 self.camera_id,
                 alert.start_time,
@@ -251,6 +305,9 @@ class SecuritySystem:
                 last_time_seen=unknown.last_seen,
                 id=unknown.id,
             )
+            for row_id in unknown.replaced_row_ids:
+                self.db.deleteUnknownFaceEncoding(row_id)
+            unknown.replaced_row_ids = []
             for i, idx in enumerate(unknown.unsaved_encodings_indices):
                 self.db.createUnknownFaceEncoding(
                     unknown_face_id=unknown.id,
@@ -258,6 +315,7 @@ class SecuritySystem:
                     img_path=unknown.img_paths[idx],
                     id=snapshots_ids[i],
                 )
+                unknown.row_ids[idx] = snapshots_ids[i]
             unknown.empty_unsaved_encodings_indices()
             # self.tracker.add_unknown(unknown)
             # self.tracker.add_snapshot(unknown, filename)
@@ -277,94 +335,323 @@ class SecuritySystem:
             return True
         return False
 
+    def read_frame(self, cap):
+        ret, frame = cap.read()
+        if not ret:
+            return None
+        self.frame_count += 1
+        return FramePacket(frame, datetime.datetime.now(), self.frame_count)
+
+    def motion_stage(self, packet):
+        packet.orig_frame = packet.frame.copy()
+        packet.motion_regions = self.motion_detector.detect_motion_regions(packet.frame)
+        packet.motion_detected = bool(packet.motion_regions)
+        return packet
+
+    def detection_regions(self, packet):
+        # None searches the whole frame.
+        return packet.motion_regions if self.detect_in_motion_regions else None
+
+    def faces_stage(self, packet):
+        if packet.motion_detected:
+            # self.tracker.update_cleanup(update_time=packet.timestamp)
+
+            # self.alarm_saved = True if self.tracker.active_alert_exists() else False
+            if self.face_tracker is not None:
+                self.track_faces(packet)
+            elif self.quality_gate is not None:
+                face_locations = self.face_recognition_util.get_face_locations(
+                    packet.frame, self.detection_regions(packet), self.detector
+                )
+                self.encode_locations(packet, face_locations)
+            else:
+                packet.face_locations, packet.encodings = (
+                    self.face_recognition_util.get_face_loc_encodings(
+                        packet.frame, self.detection_regions(packet), self.detector
+                    )
+                )
+            if (
+                self.caption_worker is not None
+                and self.caption_worker.is_ready()
+                and self.must_get_caption()
+            ):
+                self.caption_worker.submit(packet.orig_frame)
+        return packet
+
+    def track_faces(self, packet):
+        gray = tracking_gray(packet.frame)
+        if self.face_tracker.should_detect(packet.timestamp):
+            face_locations = self.face_recognition_util.get_face_locations(
+                packet.frame, self.detection_regions(packet), self.detector
+            )
+            pending = self.face_tracker.update(face_locations, gray, packet.timestamp)
+            encoded = set(
+                self.encode_locations(packet, [track.box for track in pending])
+            )
+            packet.pending_tracks = [pending[i] for i in sorted(encoded)]
+            packet.pending_encode_ids = [
+                track.encode_id for track in packet.pending_tracks
+            ]
+            self.face_tracker.defer(
+                [track for i, track in enumerate(pending) if i not in encoded]
+            )
+        else:
+            self.face_tracker.follow(gray, packet.timestamp)
+        packet.tracks, packet.face_locations = self.face_tracker.snapshot()
+        return packet
+
+    def encode_locations(self, packet, face_locations):
+        """
+        Encodes the faces passing the quality gate into packet.encodings and
+        packet.face_locations, returns their indices in `face_locations`.
+        """
+        keep = list(range(len(face_locations)))
+        if self.quality_gate is not None:
+            keep = self.quality_gate.filter(packet.frame, face_locations)
+        rgb_frame = cv2.cvtColor(packet.frame, cv2.COLOR_BGR2RGB)
+        encodings = self.face_recognition_util.get_encodings(
+            rgb_frame,
+            [face_locations[i] for i in keep],
+            self.quality_gate.max_yaw if self.quality_gate is not None else None,
+        )
+        if self.quality_gate is not None:
+            passed = self.quality_gate.drop_pose_rejects(encodings)
+            keep, encodings = [keep[i] for i in passed], encodings[passed]
+        packet.face_locations = [face_locations[i] for i in keep]
+        packet.encodings = encodings
+        return keep
+
+    def identify_faces(self, packet):
+        packet.matched_names = self.match_faces(packet.encodings)
+        if packet.tracks is None:
+            packet.names = packet.matched_names
+        else:
+            # Identities are cached on the tracks and only refreshed for re-encoded faces.
+            self.face_tracker.set_names(
+                packet.pending_tracks, packet.pending_encode_ids, packet.matched_names
+            )
+            packet.names = self.face_tracker.names(packet.tracks)
+        return packet.matched_names
+
+    def mark_first_frame(self):
+        if self.time_to_first_frame is None:
+            self.time_to_first_frame = time.perf_counter() - self.init_time
+            print(
+                f"🕒 First frame processed {round(self.time_to_first_frame, 3)} sec after start"
+            )
+            METRICS.set_gauge(
+                "time_to_first_frame_seconds",
+                self.time_to_first_frame,
+                camera=self.camera_id,
+            )
+
+    def match_stage(self, packet):
+        self.mark_first_frame()
+        if not packet.motion_detected:
+            return packet
+        self.identify_faces(packet)
+        #     if self.track_unknowns(self.tracker, packet):
+        #         print("🚨 Alert triggered!")
+
+        #     if self.tracker.active_alert_exists():
+        #         if not self.alarm_saved or (
+        #             self.alarm_saved
+        #             and (
+        #                 datetime.datetime.now() - self.alarm_updated_db_time
+        #             ).total_seconds()
+        #             > self.update_db_active_alert_per_sec
+        #         ):
+        #             self.check_make_updates()
+        #             if self.tracker.active_alert_exists():
+        #                 self.system_alert(self.tracker.active_alert, packet.orig_frame)
+        return packet
+
+    def draw_packet(self, packet):
+        frame = packet.frame
+        caption = self.caption_worker.latest() if self.caption_worker else ""
+        for (top, right, bottom, left), name in zip(
+            packet.face_locations, packet.names
+        ):
+            # person_caption = f"{name}{caption}"
+            if caption[:5] == "a man":
+                person_caption = f"{name}{caption[5:]}"
+            else:
+                person_caption = f"{name}: {caption}"
+            self.show_rect_label(frame, person_caption, top, right, bottom, left)
+        return frame
+
+    def build_pipeline(self, read_fn):
+        self.pipeline = (
+            FramePipeline(
+                report_every_sec=self.report_every_sec,
+                labels={"camera": self.camera_id},
+            )
+            .add_source("capture", read_fn)
+            .add_stage("motion", self.motion_stage)
+            .add_stage("faces", self.faces_stage)
+            .add_stage("match", self.match_stage)
+        )
+        return self.pipeline
+
+    def run_headless(self, source, pace=False, max_frames=None, captions=False):
+        """
+        Runs motion -> locate -> encode -> match -> track on every frame of
+        `source` without a window and returns a LatencyReport. With `pace` the
+        replay is throttled to the source fps, otherwise it runs flat out.
+        """
+        self.frame_count = 0
+        tracker = UnknownPersonTracker(**self.tracker_settings)
+        if captions:
+            if self.caption_handler is None or (
+                isinstance(self.caption_handler, LazyCaptionHandler)
+                and not self.caption_handler.wait()
+            ):
+                raise ValueError("Captions requested but no caption model is available")
+            # Not started: captions are computed inline so their cost shows up in the report.
+            caption_worker = CaptionWorker(
+                self.caption_handler, cache=self.caption_cache
+            )
+        frame_interval = 1.0 / source.fps if pace and source.fps else 0.0
+        report = LatencyReport()
+
+        while max_frames is None or self.frame_count < max_frames:
+            frame_start = time.perf_counter()
+            packet = report.timed("read", self.read_frame, source)
+            if packet is None:
+                break
+            report.frames += 1
+
+            packet = report.timed("motion", self.motion_stage, packet)
+            if not packet.motion_detected:
+                report.motion_skipped += 1
+            else:
+                tracker.update_cleanup(update_time=packet.timestamp)
+                if self.face_tracker is not None:
+                    report.timed("faces", self.track_faces, packet)
+                else:
+                    face_locations = report.timed(
+                        "locate",
+                        self.face_recognition_util.get_face_locations,
+                        packet.frame,
+                        self.detection_regions(packet),
+                        self.detector,
+                    )
+                    report.timed(
+                        "encode", self.encode_locations, packet, face_locations
+                    )
+                report.timed("match", self.identify_faces, packet)
+                report.timed("track", self.track_unknowns, tracker, packet)
+                if captions and self.must_get_caption():
+                    report.timed(
+                        "caption",
+                        caption_worker.get_caption,
+                        packet.orig_frame,
+                    )
+            report.add("total", time.perf_counter() - frame_start)
+            self.mark_first_frame()
+
+            if frame_interval:
+                remaining = frame_interval - (time.perf_counter() - frame_start)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+        report.finish()
+        if self.face_tracker is not None:
+            print(f"📊 Face tracks: {self.face_tracker.stats()}")
+        if self.quality_gate is not None:
+            print(f"📊 Face quality gate: {self.quality_gate.stats()}")
+        print(f"📊 Snapshot store: {tracker.snapshot_store.stats()}")
+        return report
+
+    def track_unknowns(self, tracker, packet):
+        # Locations of the encoded faces, to crop their snapshots.
+        boxes = (
+            packet.face_locations
+            if packet.tracks is None
+            else [track.box for track in packet.pending_tracks]
+        )
+        unknowns = [
+            (face_encoding, box)
+            for name, face_encoding, box in zip(
+                packet.matched_names, packet.encodings, boxes
+            )
+            if name == "Unknown"
+        ]
+        alerted = tracker.batch_update(
+            [face_encoding for face_encoding, _ in unknowns],
+            packet.timestamp,
+            packet.orig_frame,
+            [box for _, box in unknowns],
+        )
+        if not tracker.active_alert_exists() and alerted:
+            tracker.alert_all_unknowns(update_time=packet.timestamp)
+        return alerted
+
+    def start_pipeline(self):
+        self.cap = FrameGrabber(
+            open_source(self.video_source, **self.capture_settings)
+        ).start()
+        self.frame_count = 0
+        if self.caption_handler is not None:
+            self.caption_worker = CaptionWorker(
+                self.caption_handler,
+                labels={"camera": self.camera_id},
+                cache=self.caption_cache,
+            ).start()
+        METRICS.add_collector(self.publish_capture_metrics)
+        return self.build_pipeline(lambda: self.read_frame(self.cap)).start()
+
+    def publish_capture_metrics(self):
+        for name, value in self.cap.stats().items():
+            METRICS.set_gauge(f"capture_{name}_frames", value, camera=self.camera_id)
+        METRICS.set_gauge(
+            "capture_frame_age_seconds", self.cap.frame_age(), camera=self.camera_id
+        )
+
+    def stop_pipeline(self):
+        self.pipeline.stop()
+        if self.quality_gate is not None:
+            print(f"📊 Face quality gate: {self.quality_gate.stats()}")
+        if self.caption_worker is not None:
+            self.caption_worker.stop()
+        METRICS.remove_collector(self.publish_capture_metrics)
+        self.cap.release()
+
     def start_face_recognition(
         self,
+        display=True,
     ):
-        cap = cv2.VideoCapture(0)
         print("✅ Face recognition running — press 'q' to quit.")
-        caption = ""
-
-        while True:
-            # if (
-            #     time.time() - self.last_check_make_updates_time
-            #     > self.check_db_update_per_sec
-            # ):
-            #     self.check_make_updates()
-            #     self.last_check_make_updates_time = time.time()
-            #     print(
-            #         f"✅ Checked for updates at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            #     )
-
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            orig_frame = frame.copy()
-            frame_timestamp = datetime.datetime.now()
-            motion_detected = self.motion_detector.detect_motion(frame)
-            if motion_detected:
-
-                #     self.tracker.update_cleanup(update_time=frame_timestamp)
-
-                #     self.alarm_saved = True if self.tracker.active_alert_exists() else False
-                face_locations, encodings = (
-                    self.face_recognition_util.get_face_loc_encodings(frame)
-                )  # self.get_face_loc_encodings(frame)
-                alerted = False
-                # caption = ""
-                if self.must_get_caption():
-                    s_capion_time = time.time()
-                    caption = self.caption_handler.generate_caption(frame)
-                    print(
-                        "🕒 Caption took:", round(time.time() - s_capion_time, 2), "sec"
-                    )
-                    print(caption)
-                for (top, right, bottom, left), face_encoding in zip(
-                    face_locations, encodings
-                ):
-
-                    name = self.get_matches(face_encoding)
-
-                    top *= 2
-                    right *= 2
-                    bottom *= 2
-                    left *= 2
-                    # person_caption = f"{name}{caption}"
-                    if caption[:5] == "a man":
-                        person_caption = f"{name}{caption[5:]}"
-                    else:
-                        person_caption = f"{name}: {caption}"
-                    self.show_rect_label(
-                        frame, person_caption, top, right, bottom, left
-                    )
 
-            #         if name == "Unknown":
-            #             alerted = alerted or self.tracker.single_update(
-            #                 face_encoding, frame_timestamp, frame
-            #             )
-            #     if not self.tracker.active_alert_exists() and alerted:
-            #         print("🚨 Alert triggered!")
-            #         self.tracker.alert_all_unknowns(update_time=frame_timestamp)
-
-            #     if self.tracker.active_alert_exists():
-            #         if not self.alarm_saved or (
-            #             self.alarm_saved
-            #             and (
-            #                 datetime.datetime.now() - self.alarm_updated_db_time
-            #             ).total_seconds()
-            #             > self.update_db_active_alert_per_sec
-            #         ):
-            #             self.check_make_updates()
-            #             if self.tracker.active_alert_exists():
-            #                 self.system_alert(self.tracker.active_alert, orig_frame)
-
-            cv2.imshow("Face Recognition", frame)
-            if cv2.waitKey(1) == ord("q"):
-                break
+        # if (
+        #     time.time() - self.last_check_make_updates_time
+        #     > self.check_db_update_per_sec
+        # ):
+        #     self.check_make_updates()
+        #     self.last_check_make_updates_time = time.time()
+        #     print(
+        #         f"✅ Checked for updates at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        #     )
 
-        cap.release()
-        cv2.destroyAllWindows()
-        self.review_manager.stop()
+        # Capture, motion, faces and matching run on their own threads and captions
+        # come from a background CaptionWorker;
+        # imshow/waitKey stay on the main thread as OpenCV requires.
+        pipeline = self.start_pipeline()
+        try:
+            while pipeline.is_running():
+                packet = pipeline.get_output()
+                if display:
+                    if packet is not None:
+                        cv2.imshow("Face Recognition", self.draw_packet(packet))
+                    if cv2.waitKey(1) == ord("q"):
+                        break
+                pipeline.maybe_report()
+        except KeyboardInterrupt:
+            pass
+
+        self.stop_pipeline()
+        if display:
+            cv2.destroyAllWindows()
 
 
 def main():
@@ -380,6 +667,7 @@ def main():
         max_unknowns=10,
         enable_notification=False,
         max_encodings_per_person=5,
+        detect_every_n_frames=5,
         update_captions_per_sec=20,
     )
     camera.start_face_recognition()
@@ -0,0 +1,160 @@
+import os
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+from metrics import METRICS
+from utils import generate_id
+
+
+class SnapshotStore:
+    """
+    In-memory snapshots of tracked unknowns. Instead of a raw frame every
+    snapshot keeps a JPEG of the face crop, padded by `crop_padding` of the
+    face size so the face is still found when the crop is enrolled, and a
+    JPEG thumbnail of the whole frame for context.
+
+    The store is shared by all trackers of the process. Once its JPEG bytes
+    grow past `max_bytes`, the least recently used snapshots that were already
+    written to disk are dropped. Snapshots that were not saved yet are only
+    dropped when their unknown is released, and there are at most
+    max_unknowns × max_encodings_per_person of those per tracker.
+    """
+
+    def __init__(
+        self,
+        max_bytes=32 * 1024 * 1024,
+        jpeg_quality=90,
+        crop_padding=0.5,
+        thumbnail_width=320,
+    ):
+        self.max_bytes = max_bytes
+        self.jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.crop_padding = crop_padding
+        self.thumbnail_width = thumbnail_width
+        self.lock = threading.Lock()
+        # id -> [crop jpeg, context jpeg, saved]
+        self.snapshots = OrderedDict()
+        self.total_bytes = 0
+        self.evicted = 0
+
+    def crop(self, frame, box):
+        if box is None:
+            return frame
+        height, width = frame.shape[:2]
+        top, right, bottom, left = box
+        pad = int(self.crop_padding * max(bottom - top, right - left))
+        crop = frame[
+            max(0, top - pad) : min(height, bottom + pad),
+            max(0, left - pad) : min(width, right + pad),
+        ]
+        return crop if crop.size else frame
+
+    def thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        if width <= self.thumbnail_width:
+            return frame
+        scale = self.thumbnail_width / width
+        return cv2.resize(frame, (self.thumbnail_width, max(1, int(height * scale))))
+
+    def encode(self, image):
+        ok, data = cv2.imencode(".jpg", image, self.jpeg_params)
+        if not ok:
+            raise ValueError("Could not encode snapshot as JPEG")
+        return data.tobytes()
+
+    def put(self, frame, box=None):
+        """Stores the face at `box` of `frame`, returns the snapshot id (None without a frame)."""
+        if frame is None:
+            return None
+        with METRICS.timer("snapshot_encode_seconds"):
+            crop = self.encode(self.crop(frame, box))
+            context = self.encode(self.thumbnail(frame))
+        snapshot_id = generate_id()
+        with self.lock:
+            self.snapshots[snapshot_id] = [crop, context, False]
+            self.total_bytes += len(crop) + len(context)
+            self.evict()
+        return snapshot_id
+
+    def get(self, snapshot_id):
+        """(face crop, context thumbnail) as BGR images, None when not in memory."""
+        with self.lock:
+            entry = self.snapshots.get(snapshot_id)
+            if entry is None:
+                return None
+            self.snapshots.move_to_end(snapshot_id)
+        return tuple(
+            cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            for data in entry[:2]
+        )
+
+    def save(self, snapshot_id, filename):
+        """
+        Writes the face crop to `filename` and the context thumbnail next to
+        it with a `_context` suffix. Returns False when not in memory.
+        """
+        with self.lock:
+            entry = self.snapshots.get(snapshot_id)
+            if entry is None:
+                return False
+            self.snapshots.move_to_end(snapshot_id)
+        root, ext = os.path.splitext(filename)
+        with METRICS.timer("snapshot_write_seconds"):
+            for path, data in (
+                (filename, entry[0]),
+                (f"{root}_context{ext}", entry[1]),
+            ):
+                with open(path, "wb") as f:
+                    f.write(data)
+        with self.lock:
+            entry[2] = True
+            self.evict()
+        print(f"✅ Snapshot saved: {filename}")
+        return True
+
+    def release(self, snapshot_ids):
+        """Drops snapshots that are no longer needed, saved or not."""
+        with self.lock:
+            for snapshot_id in snapshot_ids:
+                entry = self.snapshots.pop(snapshot_id, None)
+                if entry is not None:
+                    self.total_bytes -= len(entry[0]) + len(entry[1])
+            self.publish()
+
+    def evict(self):
+        # Caller holds the lock.
+        if self.total_bytes > self.max_bytes:
+            for snapshot_id in [k for k, entry in self.snapshots.items() if entry[2]]:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                crop, context, _ = self.snapshots.pop(snapshot_id)
+                self.total_bytes -= len(crop) + len(context)
+                self.evicted += 1
+        self.publish()
+
+    def publish(self):
+        METRICS.set_gauge("snapshot_store_bytes", self.total_bytes)
+        METRICS.set_gauge("snapshot_store_snapshots", len(self.snapshots))
+
+    def stats(self):
+        with self.lock:
+            saved = sum(1 for entry in self.snapshots.values() if entry[2])
+            return {
+                "snapshots": len(self.snapshots),
+                "unsaved": len(self.snapshots) - saved,
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "evicted": self.evicted,
+            }
+
+
+_default_store = None
+
+
+def default_snapshot_store():
+    global _default_store
+    if _default_store is None:
+        _default_store = SnapshotStore()
+    return _default_store
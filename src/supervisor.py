@@ -0,0 +1,161 @@
+import argparse
+import os
+import time
+import cv2
+
+from db import DBInterface
+from security_system import SecuritySystem
+from caption import LazyCaptionHandler, CAPTION_BACKENDS, DECODING_PROFILES
+from utils import FaceRecognition
+from face_index import INDEX_BACKENDS
+from detectors import DETECTOR_BACKENDS
+from encoding_cache import default_encoding_cache
+
+
+class CameraSupervisor:
+    """
+    Runs the pipelines of every camera of a building in one process.
+
+    The dlib and BLIP models are loaded once: face location/encoding goes to a
+    process pool sized to the available cores and all cameras share a single
+    CaptionHandler.
+    """
+
+    def __init__(
+        self,
+        building_id,
+        num_workers=None,
+        batch_window_ms=0,
+        display=False,
+        report_every_sec=30,
+        caption_settings=None,
+        **system_kwargs,
+    ):
+        self.building_id = building_id
+        self.display = display
+        self.report_every_sec = report_every_sec
+        self.db = DBInterface()
+        self.cameras = self.db.get_cameras_on_building_id(building_id)
+        if not self.cameras:
+            raise ValueError(f"No cameras found for building {building_id}")
+
+        num_workers = num_workers if num_workers is not None else os.cpu_count()
+        print(f"✅ Starting face worker pool with {num_workers} processes...")
+        self.face_recognition_util = FaceRecognition(
+            num_workers=num_workers,
+            batch_window_ms=batch_window_ms,
+            encoding_cache=default_encoding_cache(),
+        )
+
+        print("✅ Loading shared CaptionHandler in the background...")
+        self.caption_handler = LazyCaptionHandler(**(caption_settings or {}))
+
+        self.systems = [
+            SecuritySystem(
+                camera_id=camera.id,
+                video_source=camera.camera_address,
+                face_recognition_util=self.face_recognition_util,
+                caption_handler=self.caption_handler,
+                report_every_sec=report_every_sec,
+                **system_kwargs,
+            )
+            for camera in self.cameras
+        ]
+        self.last_report_time = time.time()
+
+    def report(self):
+        total_fps = 0.0
+        print(f"📊 Building {self.building_id}: {len(self.systems)} cameras")
+        for system in self.systems:
+            stats = system.pipeline.stats()
+            fps = stats["match"]["fps"]
+            total_fps += fps
+            print(
+                f"   camera {system.camera_id}: capture {stats['capture']['fps']:.2f} fps, "
+                f"processed {fps:.2f} fps, dropped {stats['match']['dropped']}"
+            )
+        print(f"   aggregate: {total_fps:.2f} fps")
+
+    def run(self):
+        pipelines = [system.start_pipeline() for system in self.systems]
+        print(f"✅ Supervising {len(pipelines)} cameras — press Ctrl+C to quit.")
+        try:
+            while any(pipeline.is_running() for pipeline in pipelines):
+                for system in self.systems:
+                    packet = system.pipeline.get_output(timeout=0)
+                    if self.display and packet is not None:
+                        cv2.imshow(
+                            f"Camera {system.camera_id}", system.draw_packet(packet)
+                        )
+                if self.display:
+                    if cv2.waitKey(1) == ord("q"):
+                        break
+                else:
+                    time.sleep(0.05)
+
+                if time.time() - self.last_report_time > self.report_every_sec:
+                    self.report()
+                    self.last_report_time = time.time()
+        except KeyboardInterrupt:
+            pass
+
+        self.report()
+        for system in self.systems:
+            system.stop_pipeline()
+        self.face_recognition_util.shutdown()
+        if self.display:
+            cv2.destroyAllWindows()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the security pipelines of all cameras of a building."
+    )
+    parser.add_argument("building_id", type=int)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--batch-window-ms",
+        type=float,
+        default=0,
+        help="batch face encodings across cameras (use with --workers 0)",
+    )
+    parser.add_argument("--display", action="store_true")
+    parser.add_argument("--report-every-sec", type=int, default=30)
+    parser.add_argument("--metrics-path", default=None)
+    parser.add_argument("--metrics-format", choices=["prometheus", "json"])
+    parser.add_argument("--detector", choices=DETECTOR_BACKENDS, default="hog")
+    parser.add_argument("--known-index", choices=INDEX_BACKENDS, default="exact")
+    parser.add_argument("--caption-backend", choices=CAPTION_BACKENDS, default="eager")
+    parser.add_argument(
+        "--caption-decoding", choices=list(DECODING_PROFILES), default="nucleus"
+    )
+    args = parser.parse_args()
+    if args.batch_window_ms > 0 and args.workers != 0:
+        parser.error("--batch-window-ms only works with --workers 0")
+
+    supervisor = CameraSupervisor(
+        building_id=args.building_id,
+        num_workers=args.workers,
+        batch_window_ms=args.batch_window_ms,
+        display=args.display,
+        report_every_sec=args.report_every_sec,
+        metrics_path=args.metrics_path,
+        metrics_format=args.metrics_format or "prometheus",
+        known_index=args.known_index,
+        detector=args.detector,
+        caption_settings=dict(
+            backend=args.caption_backend, decoding=args.caption_decoding
+        ),
+        alert_after_sec=5,
+        forget_after_sec=30,
+        match_unknown_threshold=0.6,
+        match_known_threshold=0.5,
+        max_unknowns=10,
+        max_encodings_per_person=5,
+        update_captions_per_sec=20,
+    )
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,48 @@
-import numpy as np
-from utils import generate_id, save_snapshot, NULL_ENCODING
+import heapq
+import itertools
+import time
+from utils import generate_id
 from alert import *
-import face_recognition
 import os
+from metrics import METRICS
+from face_index import PersonEncodingArena, assign_greedy
+from snapshot_store import default_snapshot_store
 
 SNAPSHOTS_FOLDER = "snapshots"
+ALERT_DEADLINE = "alert"
+
+
+class DeadlineQueue:
+    """
+    Min-heap of (deadline, key). Rescheduled and cancelled keys stay in the
+    heap and are skipped when they reach its top, so every operation is
+    O(log n) and pop_expired() only touches what expired.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, key, deadline):
+        self.deadlines[key] = deadline
+        heapq.heappush(self.heap, (deadline, next(self.counter), key))
+
+    def cancel(self, key):
+        self.deadlines.pop(key, None)
+
+    def pop_expired(self, now):
+        """Keys whose deadline is before `now`, earliest first."""
+        expired = []
+        while self.heap and self.heap[0][0] < now:
+            deadline, _, key = heapq.heappop(self.heap)
+            if self.deadlines.get(key) == deadline:
+                del self.deadlines[key]
+                expired.append(key)
+        return expired
 
 
 class UnknownPersonTracker:
@@ -17,10 +55,11 @@ class UnknownPersonTracker:
         max_unknowns=10,
         max_encodings_per_person=5,
         active_alert=None,
+        snapshot_store=None,
+        clock=time.monotonic,
     ):
         self.unknowns = []
         self.unknown_ids = set()
-        self.unknown_encodings = []
         self.alert_after_sec = alert_after_sec
         self.forget_after_sec = forget_after_sec
         self.match_unknown_threshold = match_unknown_threshold
@@ -28,33 +67,34 @@ class UnknownPersonTracker:
         self.max_unknowns = max_unknowns
         self.max_encodings_per_person = max_encodings_per_person
         self.active_alert = active_alert
+        self.unknown_encodings = self.new_encoding_arena()
+        self.snapshot_store = (
+            snapshot_store if snapshot_store is not None else default_snapshot_store()
+        )
+        # Tracked unknowns are forgotten and alerts expire `forget_after_sec`
+        # after they started, on the monotonic `clock`.
+        self.clock = clock
+        self.deadlines = DeadlineQueue()
+        if active_alert is not None:
+            age = (active_alert.update_time - active_alert.start_time).total_seconds()
+            self.deadlines.schedule(
+                ALERT_DEADLINE, self.clock() + forget_after_sec - age
+            )
 
-    def _find_similar(self, encoding, encodings, threshold):
-        if not encodings:
-            return None
-
-        face_distances = face_recognition.face_distance(np.array(encodings), encoding)
-
-        if len(face_distances) == 0:
-            return None
-
-        best_match_index = face_distances.argmin()
-        best_distance = face_distances[best_match_index]
-
-        if best_distance < threshold:
-            return best_match_index
-
-        return None
+    def new_encoding_arena(self):
+        return PersonEncodingArena(self.max_unknowns, self.max_encodings_per_person)
 
     def cleanup(self, update_time):
-        to_delete_indices = [
-            idx
-            for idx in range(len(self.unknowns) - 1, -1, -1)
-            if (
-                not self.unknowns[idx].alerted
-                and self.unknowns[idx].duration > self.forget_after_sec
-            )
-        ]
+        expired = set(self.deadlines.pop_expired(self.clock()))
+        alert_expired = ALERT_DEADLINE in expired
+        expired.discard(ALERT_DEADLINE)
+        to_delete_indices = []
+        if expired:
+            to_delete_indices = [
+                idx
+                for idx, unknown in enumerate(self.unknowns)
+                if unknown.id in expired
+            ]
         if len(to_delete_indices):
             print(f"Deleting {len(to_delete_indices)} unknowns.")
             print(
@@ -66,126 +106,122 @@ class UnknownPersonTracker:
                 f"After deletion: {len(self.unknowns)} unknowns, {len(self.unknown_encodings)} encodings, {len(self.unknown_ids)} ids."
             )
 
-        if self.active_alert and (
-            (
-                self.active_alert.update_time - self.active_alert.start_time
-            ).total_seconds()
-            > self.forget_after_sec
-        ):
-            self.active_alert = None
+        if self.active_alert and alert_expired:
+            self.deactivate_alert()
             print("⚠️ Alert expired, no unknowns detected.")
         # elif self.active_alert is not None:
         # print("⚠️ Alert still active, unknowns detected.")
 
     def update_durations(self, update_time):
-        for person in self.unknowns:
-            person.update_duration(update_time)
-
+        # Durations of the unknowns are only computed when they are seen.
         if self.active_alert is not None:
             self.active_alert.update_time = update_time
-            for person in self.active_alert.unknowns:
-                person.update_duration(update_time)
 
     def update_cleanup(self, update_time):
         self.update_durations(update_time)
         self.cleanup(update_time)
 
     def del_unknowns(self, instance, unknown_indices):
-        for unknown_idx in unknown_indices:
-            for i in range(
-                (unknown_idx + 1) * self.max_encodings_per_person - 1,
-                unknown_idx * self.max_encodings_per_person - 1,
-                -1,
-            ):
-                instance.unknown_encodings.pop(i)
-        for unknown_idx in unknown_indices:
-            instance.unknown_ids.remove(instance.unknowns[unknown_idx].id)
-            instance.unknowns.pop(unknown_idx)
-
-    def hash_encodings_idx(self, idx):
-        return idx // self.max_encodings_per_person
-
-    def update_seen_unknown(self, instance, idx, new_encoding, frame):
-        unknown = instance.unknowns[idx]
-
-        nxt_person_encoding_idx = unknown.get_total_encodings()
-        if nxt_person_encoding_idx < self.max_encodings_per_person:
-            instance.unknown_encodings[
-                idx * self.max_encodings_per_person + nxt_person_encoding_idx
-            ] = new_encoding
-
-        unknown.add_snapshots_info([frame], [new_encoding])
+        deleted = set(unknown_indices)
+        for unknown_idx in deleted:
+            unknown = instance.unknowns[unknown_idx]
+            instance.unknown_encodings.remove_person(unknown.slot)
+            instance.unknown_ids.remove(unknown.id)
+            unknown.release_snapshots()
+            self.deadlines.cancel(unknown.id)
+        instance.unknowns = [
+            unknown
+            for idx, unknown in enumerate(instance.unknowns)
+            if idx not in deleted
+        ]
 
-    def single_update(self, new_encoding, update_time, frame):
-        if self.active_alert is not None:
-            enc_idx = self._find_similar(
-                new_encoding,
-                self.active_alert.unknown_encodings,
-                self.match_unknown_threshold,
-            )
-            if enc_idx is not None:
-                idx = self.hash_encodings_idx(enc_idx)
-                self.update_seen_unknown(
-                    self.active_alert,
-                    idx,
-                    new_encoding,
-                    frame,
-                )
-                # print(f"Updated alarmed unknown: {self.active_alert.unknowns[idx].id}")
-            else:
+    def update_seen_unknown(
+        self, instance, slot, new_encoding, frame, box=None, update_time=None
+    ):
+        unknown = instance.unknown_encodings.people[slot]
+        if unknown.snapshot_store is None:
+            # Unknowns restored from the db have no store yet, snapshots put in
+            # ours must be saved and released through it.
+            unknown.snapshot_store = self.snapshot_store
+        unknown.update_duration(update_time, self.clock())
+        index = instance.unknown_encodings.add_representative(slot, new_encoding)
+        if index is not None:
+            snapshot = self.snapshot_store.put(frame, box)
+            unknown.set_snapshot_info(index, snapshot, new_encoding)
+        return unknown
+
+    @METRICS.timed("unknown_batch_update_seconds")
+    def batch_update(self, new_encodings, update_time, frame, boxes=None):
+        """
+        Updates the alerted or tracked unknowns with all unknown faces of a
+        frame at once. The faces are assigned jointly (see assign_greedy), so
+        two faces of one frame never update the same person, and the faces
+        left unassigned are added as new unknowns. `boxes` are the face
+        locations in `frame`, used to crop their snapshots. Returns True when
+        a tracked unknown should be alerted.
+        """
+        if len(new_encodings) == 0:
+            return False
+        instance = self.active_alert if self.active_alert is not None else self
+        assignment = assign_greedy(
+            instance.unknown_encodings.person_distances(new_encodings),
+            self.match_unknown_threshold,
+        )
+        boxes = boxes if boxes is not None else [None] * len(new_encodings)
+        alerted = False
+        for new_encoding, slot, box in zip(new_encodings, assignment, boxes):
+            if slot < 0:
                 self.add_unknown(
-                    instance=self.active_alert,
+                    instance=instance,
                     encodings=[new_encoding],
                     update_time=update_time,
                     snapshots=[frame],
+                    boxes=[box],
                 )
-                # print(f"Added unknown to alarm: {self.active_alert.unknowns[-1].id}")
-                # print(f"Total alarmed unknowns: {len(self.active_alert.unknowns)}")
-            return False
-
-        enc_idx = self._find_similar(
-            new_encoding, self.unknown_encodings, self.match_unknown_threshold
-        )
-        if enc_idx is not None:
-            idx = self.hash_encodings_idx(enc_idx)
-            self.update_seen_unknown(self, idx, new_encoding, frame)
-            # print(f"Updated unknown: {self.unknowns[idx].id}")
-            if not self.unknowns[idx].alerted and (
-                self.unknowns[idx].duration > self.alert_after_sec
-            ):
-                return True
-        else:
-            self.add_unknown(
-                instance=self,
-                encodings=[new_encoding],
-                update_time=update_time,
-                snapshots=[frame],
+                continue
+            unknown = self.update_seen_unknown(
+                instance, slot, new_encoding, frame, box, update_time
             )
-            # print(f"Added unknown: {self.unknowns[-1].id}")
-            # print(f"Total non-alarmed unknowns: {len(self.unknowns)}")
-        return False
+            if (
+                instance is self
+                and not unknown.alerted
+                and unknown.duration > self.alert_after_sec
+            ):
+                alerted = True
+        return alerted
 
-    def add_unknown(self, instance, encodings, update_time, snapshots):
-        if len(self.unknowns) >= self.max_unknowns:
-            print(f"⚠️ Too many unknowns ({len(self.unknowns)}), ignoring new one.")
+    def add_unknown(self, instance, encodings, update_time, snapshots, boxes=None):
+        """`snapshots` are frames, stored in the snapshot store cropped to `boxes`."""
+        if instance.unknown_encodings.full():
+            print(f"⚠️ Too many unknowns ({len(instance.unknowns)}), ignoring new one.")
             return False
+        snapshots = snapshots[: self.max_encodings_per_person]
+        boxes = boxes if boxes is not None else [None] * len(snapshots)
         unknown = UnknownPerson(
             encodings=encodings,
             first_seen=update_time,
-            snapshots=snapshots,
+            snapshots=[
+                self.snapshot_store.put(frame, box)
+                for frame, box in zip(snapshots, boxes)
+            ],
             max_encodings=self.max_encodings_per_person,
+            snapshot_store=self.snapshot_store,
+            first_seen_clock=self.clock(),
         )
+        unknown.slot = instance.unknown_encodings.add_person(unknown, unknown.encodings)
         instance.unknowns.append(unknown)
-        instance.unknown_ids.add(instance.unknowns[-1].id)
-        if len(encodings) < self.max_encodings_per_person:
-            encodings.extend(
-                [NULL_ENCODING] * (self.max_encodings_per_person - len(encodings))
+        instance.unknown_ids.add(unknown.id)
+        if instance is self:
+            self.deadlines.schedule(
+                unknown.id, unknown.first_seen_clock + self.forget_after_sec
             )
-        instance.unknown_encodings.extend(encodings)
+        return True
 
     def alert_all_unknowns(self, update_time):
         for unknown in self.unknowns:
             unknown.alert_person()
+            self.deadlines.cancel(unknown.id)
+        self.deadlines.schedule(ALERT_DEADLINE, self.clock() + self.forget_after_sec)
 
         self.active_alert = Alert(
             unknown_ids=self.unknown_ids,
@@ -194,7 +230,7 @@ class UnknownPersonTracker:
             update_time=update_time,
         )
 
-        self.unknown_encodings = []
+        self.unknown_encodings = self.new_encoding_arena()
         self.unknown_ids = set()
         self.unknowns = []
 
@@ -222,23 +258,25 @@ class UnknownPersonTracker:
             self.update_unknowns_after_new_knowns(self, new_known_encodings)
 
     def update_unknowns_after_new_knowns(self, instance, new_known_encodings):
-        to_delete_indices = []
-        for idx in range(len(instance.unknowns) - 1, -1, -1):
-            unknown = instance.unknowns[idx]
-            for i in range(len(unknown.encodings)):
-                if unknown.encodings[i] is not None:
-                    enc_idx = self._find_similar(
-                        unknown.encodings[i],
-                        new_known_encodings,
-                        self.match_known_threshold,
-                    )
-                    if enc_idx is not None:
-                        to_delete_indices.append(idx)
-                        break
+        # Every stored unknown encoding against every new known one at once.
+        slots = set(
+            instance.unknown_encodings.slots_near(
+                new_known_encodings, self.match_known_threshold
+            ).tolist()
+        )
+        to_delete_indices = [
+            idx
+            for idx, unknown in enumerate(instance.unknowns)
+            if unknown.slot in slots
+        ]
         if len(to_delete_indices) > 0:
             self.del_unknowns(instance, to_delete_indices)
 
     def deactivate_alert(self):
+        self.deadlines.cancel(ALERT_DEADLINE)
+        if self.active_alert is not None:
+            for unknown in self.active_alert.unknowns:
+                unknown.release_snapshots()
         self.active_alert = None
 
 
@@ -254,14 +292,25 @@ class UnknownPerson:
         all_encodings_saved=False,
         all_img_saved=False,
         img_paths=[],
+        snapshot_store=None,
+        first_seen_clock=None,
+        row_ids=None,
     ):
         self.id = generate_id() if id is None else id
+        # Rows of the person in the tracker's PersonEncodingArena.
+        self.slot = None
         self.encodings = encodings[:max_encodings]
         self.first_seen = first_seen
         self.last_seen = first_seen
+        # Monotonic time of first_seen, durations are measured from it.
+        self.first_seen_clock = (
+            time.monotonic() if first_seen_clock is None else first_seen_clock
+        )
         self.alerted = alerted
         self.duration = 0
+        # Snapshot ids in `snapshot_store` (None for unknowns loaded from the db).
         self.snapshots = snapshots[:max_encodings]
+        self.snapshot_store = snapshot_store
         self.max_encodings = max_encodings
         self.unsaved_encodings_indices = (
             list(range(0, len(encodings))) if not all_encodings_saved else []
@@ -269,7 +318,13 @@ class UnknownPerson:
         self.unsaved_images_indices = (
             list(range(0, len(encodings))) if not all_img_saved else []
         )
-        self.img_paths = img_paths
+        self.img_paths = list(img_paths)
+        # UnknownFaceEncoding row id of every saved encoding (None until saved),
+        # and the rows of replaced encodings that still have to be deleted.
+        self.row_ids = (
+            list(row_ids) if row_ids is not None else [None] * len(self.encodings)
+        )
+        self.replaced_row_ids = []
 
     def empty_unsaved_encodings_indices(self):
         self.unsaved_encodings_indices = []
@@ -290,14 +345,22 @@ class UnknownPerson:
             filename = os.path.join(
                 snapshot_folder, f"unknown_{self.id}_{snapshot_id}.jpg"
             )
-            save_snapshot(self.snapshots[i], filename)
-            self.img_paths.append(filename)
+            saved = (
+                self.snapshot_store is not None
+                and self.snapshots[i] is not None
+                and self.snapshot_store.save(self.snapshots[i], filename)
+            )
+            self.img_paths.extend([None] * (i + 1 - len(self.img_paths)))
+            self.img_paths[i] = filename if saved else None
         self.empty_unsaved_images_indices()
         return snapshots_ids
 
-    def update_duration(self, last_seen):
-        self.last_seen = last_seen
-        self.duration = (self.last_seen - self.first_seen).total_seconds()
+    def update_duration(self, last_seen, now=None):
+        """Records a sighting at `last_seen`, `now` is the monotonic time of it."""
+        if last_seen is not None:
+            self.last_seen = last_seen
+        now = time.monotonic() if now is None else now
+        self.duration = now - self.first_seen_clock
         return self.duration
 
     def add_snapshots_info(self, snapshots, encodings):
@@ -311,6 +374,31 @@ class UnknownPerson:
             )
             self.snapshots.extend(snapshots[:add_encodings])
             self.encodings.extend(encodings[:add_encodings])
+            self.row_ids.extend([None] * len(encodings[:add_encodings]))
+
+    def set_snapshot_info(self, index, snapshot, encoding):
+        """Stores a representative encoding at `index`, appended or replacing one."""
+        if index == len(self.encodings):
+            self.add_snapshots_info([snapshot], [encoding])
+            return
+        self.release_snapshots([self.snapshots[index]])
+        self.snapshots[index] = snapshot
+        self.encodings[index] = encoding
+        # Saved again as a new encoding row with a new snapshot, the old row is
+        # deleted then so the saved rows are always the current representatives.
+        if self.row_ids[index] is not None:
+            self.replaced_row_ids.append(self.row_ids[index])
+            self.row_ids[index] = None
+        if index not in self.unsaved_encodings_indices:
+            self.unsaved_encodings_indices.append(index)
+            self.unsaved_images_indices.append(index)
+
+    def release_snapshots(self, snapshots=None):
+        """Drops `snapshots` (all of the person's by default) from the snapshot store."""
+        if snapshots is None:
+            snapshots, self.snapshots = self.snapshots, [None] * len(self.snapshots)
+        if self.snapshot_store is not None:
+            self.snapshot_store.release([s for s in snapshots if s is not None])
 
     def get_total_encodings(self):
         return len(self.encodings)
@@ -1,8 +1,10 @@
 import uuid
-import face_recognition
 import csv
+import importlib
 import cv2
 import numpy as np
+from metrics import METRICS
+from detectors import get_detector
 
 NULL_ENCODING = np.zeros((128,), dtype=np.float64)
 
@@ -16,6 +18,8 @@ NULL_ENCODING = np.zeros((128,), dtype=np.float64)
 
 
 def get_face_encodings(image_path):
+    import face_recognition
+
     try:
         print(f"🖼️ Loading image from: {image_path}")
         image = face_recognition.load_image_file(image_path)
@@ -32,41 +36,362 @@ def get_face_encodings(image_path):
     return None
 
 
+import queue
 import threading
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+
+def face_distance(encodings, face_encoding):
+    # Same as face_recognition.face_distance, without importing dlib.
+    if len(encodings) == 0:
+        return np.empty((0,))
+    return np.linalg.norm(np.asarray(encodings) - face_encoding, axis=1)
+
+
+def scale_box(box, scale, offset_x=0, offset_y=0):
+    top, right, bottom, left = box
+    return (
+        int(round(top / scale)) + offset_y,
+        int(round(right / scale)) + offset_x,
+        int(round(bottom / scale)) + offset_y,
+        int(round(left / scale)) + offset_x,
+    )
+
+
+def locate_faces(frame, detector=None):
+    """
+    Face locations as (top, right, bottom, left) in full-frame coordinates,
+    found by the `detector` (backend, settings) pair at its own scale.
+    """
+    face_detector = get_detector(detector)
+    scale = face_detector.scale
+    small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+    return [scale_box(box, scale) for box in face_detector.detect(small_frame)]
+
+
+def pad_merge_regions(regions, width, height, padding=0.25):
+    # Pads every (top, right, bottom, left) region and merges the overlapping
+    # ones, so no face is searched (and found) twice.
+    padded = []
+    for top, right, bottom, left in regions:
+        pad_x, pad_y = int((right - left) * padding), int((bottom - top) * padding)
+        padded.append(
+            [
+                max(0, top - pad_y),
+                min(width, right + pad_x),
+                min(height, bottom + pad_y),
+                max(0, left - pad_x),
+            ]
+        )
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(padded)):
+            for j in range(len(padded) - 1, i, -1):
+                a, b = padded[i], padded[j]
+                if a[3] < b[1] and b[3] < a[1] and a[0] < b[2] and b[0] < a[2]:
+                    padded[i] = [
+                        min(a[0], b[0]),
+                        max(a[1], b[1]),
+                        max(a[2], b[2]),
+                        min(a[3], b[3]),
+                    ]
+                    padded.pop(j)
+                    merged = True
+    return padded
+
+
+def locate_faces_in_regions(
+    frame,
+    regions,
+    detector=None,
+    padding=0.25,
+    target_size=320,
+    min_scale=0.5,
+    max_scale=2.0,
+):
+    """
+    Runs the detector only inside the padded motion `regions`. Each region is
+    resized so its longer side is about `target_size` (within min/max scale),
+    which upsamples small regions so distant faces are still found. Locations
+    are returned in full-frame coordinates.
+    """
+    face_detector = get_detector(detector)
+    height, width = frame.shape[:2]
+    face_locations = []
+    for top, right, bottom, left in pad_merge_regions(regions, width, height, padding):
+        if right - left < 8 or bottom - top < 8:
+            continue
+        scale = min(
+            max_scale, max(min_scale, target_size / max(right - left, bottom - top))
+        )
+        roi = cv2.resize(frame[top:bottom, left:right], (0, 0), fx=scale, fy=scale)
+        face_locations.extend(
+            scale_box(box, scale, offset_x=left, offset_y=top)
+            for box in face_detector.detect(roi)
+        )
+    return face_locations
+
+
+def encode_faces_batch(rgb_frames, face_locations_list, num_jitters=1, max_yaw=None):
+    """
+    Encodes every face of every frame with a single dlib call and returns one
+    contiguous (n_faces, 128) array per frame, in face_locations order.
+    With `max_yaw`, faces turned further than that (see face_yaw) are not
+    encoded and get a row of NaN instead.
+    """
+    import dlib
+    from face_recognition import api
+    from face_quality import face_yaw
+
+    results = [np.full((len(locs), 128), np.nan) for locs in face_locations_list]
+    batch_frames, batch_landmarks, batch_rows = [], [], []
+    for idx, (rgb_frame, face_locations) in enumerate(
+        zip(rgb_frames, face_locations_list)
+    ):
+        if len(face_locations) == 0:
+            continue
+        landmarks, rows = dlib.full_object_detections(), []
+        for row, landmark in enumerate(
+            api._raw_face_landmarks(rgb_frame, face_locations, "small")
+        ):
+            if max_yaw is None or face_yaw(landmark) <= max_yaw:
+                landmarks.append(landmark)
+                rows.append(row)
+        if rows:
+            batch_frames.append(rgb_frame)
+            batch_landmarks.append(landmarks)
+            batch_rows.append((idx, rows))
+
+    if batch_frames:
+        descriptors = api.face_encoder.compute_face_descriptor(
+            batch_frames, batch_landmarks, num_jitters
+        )
+        for (idx, rows), vectors in zip(batch_rows, descriptors):
+            results[idx][rows] = [np.array(vector) for vector in vectors]
+    return [np.ascontiguousarray(result) for result in results]
+
+
+def encode_faces(rgb_frame, face_locations, max_yaw=None):
+    return encode_faces_batch([rgb_frame], [face_locations], max_yaw=max_yaw)[0]
+
+
+def detect_faces(frame, regions=None, detector=None):
+    if regions is None:
+        return locate_faces(frame, detector)
+    return locate_faces_in_regions(frame, regions, detector)
+
+
+def locate_encode_faces(frame, regions=None, detector=None):
+    face_locations = detect_faces(frame, regions, detector)
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return face_locations, encode_faces(rgb_frame, face_locations)
+
+
+class EncodingBatcher:
+    """
+    Collects encoding requests from several callers (e.g. cameras sharing one
+    FaceRecognition) for up to `window_sec` and encodes them in one dlib call.
+    """
+
+    def __init__(self, encode_batch_fn, window_sec=0.005, max_batch=16):
+        self.encode_batch_fn = encode_batch_fn
+        self.window_sec = window_sec
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, rgb_frame, face_locations, max_yaw=None):
+        future = Future()
+        self.requests.put((rgb_frame, face_locations, max_yaw, future))
+        return future
+
+    def next_batch(self):
+        try:
+            batch = [self.requests.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.window_sec
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while self.running:
+            batch = self.next_batch()
+            if not batch:
+                continue
+            # Callers normally share one max_yaw, so this is a single dlib call.
+            for max_yaw in {request[2] for request in batch}:
+                group = [request for request in batch if request[2] == max_yaw]
+                try:
+                    results = self.encode_batch_fn(
+                        [request[0] for request in group],
+                        [request[1] for request in group],
+                        max_yaw,
+                    )
+                    for request, result in zip(group, results):
+                        request[3].set_result(result)
+                except Exception as e:
+                    for request in group:
+                        request[3].set_exception(e)
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=5)
+
+
+def init_face_worker():
+    # Runs once in every pool process so each worker loads its own dlib models.
+    importlib.import_module("face_recognition")
+
+
+def encode_image_file(image_path):
+    import face_recognition
+
+    image = face_recognition.load_image_file(image_path)
+    encodings = face_recognition.face_encodings(image)
+    return encodings[0] if encodings else None
+
+
+def completed_future(fn, *args):
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
 
 
 class FaceRecognition:
-    def __init__(self):
+    """
+    Face detection and encoding engine.
+
+    With num_workers > 0 jobs run on a pool of spawned processes, each holding
+    its own copy of the dlib models, so callers on any thread (camera
+    pipelines, the enrollment listener) run in parallel instead of queueing
+    on one lock. With num_workers == 0 jobs run inline under a lock. The
+    submit_* methods return futures either way.
+    """
+
+    def __init__(
+        self,
+        num_workers=0,
+        batch_window_ms=0,
+        encoding_cache=None,
+        detector="hog",
+        detector_settings=None,
+    ):
         self.lock = threading.Lock()
+        self.encoding_cache = encoding_cache
+        # Default (backend, settings) of detectors.get_detector(), overridable per call.
+        self.detector = (detector, detector_settings or {})
+        self.pool = (
+            ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_face_worker,
+            )
+            if num_workers > 0
+            else None
+        )
+        if batch_window_ms > 0 and self.pool is not None:
+            # Pool workers already run the cameras' encodes in parallel.
+            print("⚠️ batch_window_ms is ignored with a worker pool (num_workers > 0)")
+            batch_window_ms = 0
+        self.batcher = (
+            EncodingBatcher(self.encode_batch, window_sec=batch_window_ms / 1000)
+            if batch_window_ms > 0
+            else None
+        )
+        if self.pool is None:
+            # face_recognition loads the dlib models at import, do it off the startup path.
+            threading.Thread(
+                target=importlib.import_module, args=("face_recognition",), daemon=True
+            ).start()
+
+    def submit(self, fn, *args):
+        if self.pool is not None:
+            return self.pool.submit(fn, *args)
+        with self.lock:
+            return completed_future(fn, *args)
+
+    def submit_detect(self, frame, regions=None, detector=None):
+        return self.submit(detect_faces, frame, regions, detector or self.detector)
+
+    def submit_encode(self, rgb_frame, face_locations, max_yaw=None):
+        # Faces turned further than max_yaw come back as NaN rows, see face_quality.
+        if self.batcher is not None:
+            return self.batcher.submit(rgb_frame, face_locations, max_yaw)
+        return self.submit(encode_faces, rgb_frame, face_locations, max_yaw)
+
+    def submit_locate_encode(self, frame, regions=None, detector=None):
+        return self.submit(
+            locate_encode_faces, frame, regions, detector or self.detector
+        )
+
+    def submit_image_encoding(self, image_path):
+        return self.submit(encode_image_file, image_path)
 
     def get_face_encodings(self, image_path):
         try:
-            image = face_recognition.load_image_file(image_path)
-            with self.lock:
-                encodings = face_recognition.face_encodings(image)
-            if encodings:
-                return encodings[0]
+            if self.encoding_cache is not None:
+                encoding = self.encoding_cache.get_or_compute(
+                    image_path, lambda path: self.submit_image_encoding(path).result()
+                )
             else:
-                print(f"⚠️ No face encodings found in {image_path}")
+                encoding = self.submit_image_encoding(image_path).result()
+            if encoding is not None:
+                return encoding
+            print(f"⚠️ No face encodings found in {image_path}")
         except Exception as e:
             print(f"❌ Error during face encoding for {image_path}: {e}")
 
         return None
 
-    def get_face_loc_encodings(self, frame):
-        small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-        rgb_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-        with self.lock:
-            face_locations = face_recognition.face_locations(rgb_frame)
-            encodings = []
-            for face_location in face_locations:
-                enc = face_recognition.face_encodings(rgb_frame, [face_location])
-                if enc:
-                    encodings.append(enc[0])
-        return face_locations, encodings
+    @METRICS.timed("face_loc_encodings_seconds")
+    def get_face_loc_encodings(self, frame, regions=None, detector=None):
+        """
+        Face locations in full-frame coordinates and their (n, 128) encodings.
+        With `regions` only those parts of the frame are searched.
+        """
+        if self.pool is not None:
+            return self.submit_locate_encode(frame, regions, detector).result()
+        face_locations = self.get_face_locations(frame, regions, detector)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return face_locations, self.get_encodings(rgb_frame, face_locations)
+
+    @METRICS.timed("face_locations_seconds")
+    def get_face_locations(self, frame, regions=None, detector=None):
+        return self.submit_detect(frame, regions, detector).result()
+
+    @METRICS.timed("face_encodings_seconds")
+    def get_encodings(self, rgb_frame, face_locations, max_yaw=None):
+        return self.submit_encode(rgb_frame, face_locations, max_yaw).result()
+
+    def encode_batch(self, rgb_frames, face_locations_list, max_yaw=None):
+        return self.submit(
+            encode_faces_batch, rgb_frames, face_locations_list, 1, max_yaw
+        ).result()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        if self.pool is not None:
+            self.pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+        if self.batcher is not None:
+            self.batcher.stop()
 
     def get_best_distance_idx(self, encodings, face_encoding):
-        face_distances = face_recognition.face_distance(encodings, face_encoding)
+        face_distances = face_distance(encodings, face_encoding)
 
         if len(face_distances) == 0:
             return None, None
@@ -103,6 +428,18 @@ def append_dict_to_csv(file_path, data_dict):
         writer.writerow(data_dict)
 
 
+def append_dicts_to_csv(file_path, data_dicts):
+    # One open and one write for many rows with the same columns.
+    if not data_dicts:
+        return
+    if not csv_exists(file_path):
+        create_csv(file_path, data_dicts[0].keys())
+
+    with open(file_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=data_dicts[0].keys())
+        writer.writerows(data_dicts)
+
+
 def csv_exists(file_path):
     try:
         with open(file_path, "r") as f:
@@ -218,6 +555,7 @@ def create_or_update_row(file_path, data_dict, class_type):
     append_dict_to_csv(file_path, data_dict)
 
 
+@METRICS.timed("snapshot_write_seconds")
 def save_snapshot(frame, filename):
     cv2.imwrite(filename, frame)
     print(f"✅ Snapshot saved: {filename}")